@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+"""
+Timing benchmarks of the load, calibrate and render paths of the viewer on synthetic files.
+Run from the repository directory:
+
+    python benchmarks.py -o results.json                     # save results of this revision
+    python benchmarks.py -b results.json --threshold 0.2     # fail if >20% slower than saved results
+    python benchmarks.py --legacy                            # compare with the former implementations
+
+Results are {"info": {...}, "results": {"<benchmark>.<case>": best time in seconds}}.
+"""
+
+import argparse
+import atexit
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Results must not depend on the calibration profile, file cache and profiling settings
+# of the user running the benchmarks, so they are set before the viewer modules read them
+SETTINGS_DIR = tempfile.mkdtemp(prefix="lakeshore_benchmarks_")
+atexit.register(shutil.rmtree, SETTINGS_DIR, True)
+os.environ["LAKESHORE_VIEWER_CONFIG"] = os.path.join(SETTINGS_DIR, "config")
+os.environ["LAKESHORE_VIEWER_CACHE"] = os.path.join(SETTINGS_DIR, "cache")
+os.environ["LAKESHORE_VIEWER_PROFILE"] = "0"
+
+import numpy as np
+import xlrd
+from calibration import ChannelCalibration
+from channel_store import FileRecord, to_columns
+from file_parsers import parse_lakeshore_xls, parse_pressure_csv, N_SENSORS
+from time_utilities import timestr_to_seconds, second_to_timestr, SECONDS_PER_DAY
+
+XLS_MAX_ROWS = 65536  # Limit of .xls (BIFF8) format
+MIN_REGRESSION = 0.002  # s, smaller slowdowns are timer noise
+
+
+def best_time(func, repeat=3):
+    """Returns best wall time of several runs of func() in seconds"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def bench_calibration(n_points=200000, legacy=False):
+    """CalibrationDialog.applyCalibration, i.e. ChannelCalibration.evaluateArray"""
+    calib = ChannelCalibration()
+    calib.R_offset = 0.1
+    calib.R_scale = 1.01
+    vals = np.random.uniform(20.0, 100.0, n_points)  # Ohms inside Pt100 curve range
+
+    def batch_T():
+        return calib.evaluateArray(True, vals)
+
+    def batch_R():
+        return calib.evaluateArray(False, vals)
+
+    results = {"calibration.T": best_time(batch_T), "calibration.R": best_time(batch_R)}
+    print("Calibration of {} points: T {:.5f} s, R {:.5f} s".format(
+        n_points, results["calibration.T"], results["calibration.R"]))
+    if legacy:
+        def per_element():  # Former CalibrationDialog.applyCalibration implementation
+            return [calib.evaluateT(v) for v in vals]
+
+        assert np.allclose(np.array(per_element(), dtype=np.float64), batch_T())
+        t_loop = best_time(per_element, repeat=1)
+        print("    per-element loop {:.3f} s, speedup x{:.0f}".format(t_loop, t_loop / results["calibration.T"]))
+    return results
+
+
+def write_synthetic_lakeshore_xls(filename, n_rows):
+    """Writes Lakeshore-like export with n_rows samples every second. Requires xlwt"""
+    import xlwt
+    n_rows = min(n_rows, XLS_MAX_ROWS - 4)
+    book = xlwt.Workbook()
+    sh = book.add_sheet("Data")
+    sh.write(0, 0, "Lakeshore 218 data log")
+    sh.write(1, 0, "Start time")
+    sh.write(1, 1, "Thu Jan 21 14:04:03 NOVT 2021")
+    sh.write(3, 0, "Time (ms)")
+    for s in range(N_SENSORS):
+        sh.write(3, 1 + s, "Sensor " + str(s + 1))
+    rng = np.random.default_rng(0)
+    ys = rng.uniform(20.0, 100.0, (n_rows, N_SENSORS))
+    for r in range(n_rows):
+        sh.write(4 + r, 0, 1000.0 * r)
+        for s in range(N_SENSORS):
+            if r % 1000 == 999 and s == 2:
+                sh.write(4 + r, 1 + s, "OVER")  # Non-numeric readings happen in real files
+            else:
+                sh.write(4 + r, 1 + s, ys[r, s])
+    book.save(filename)
+    return n_rows
+
+
+def parse_lakeshore_cells(filename):
+    """Former cell-by-cell implementation of FileDialog.parse_lakeshore_file (for comparison)"""
+    book = xlrd.open_workbook(filename)
+    sh = book.sheet_by_index(0)
+    start_time = timestr_to_seconds(sh.cell_value(rowx=1, colx=1).split(" ")[3])
+    xs, ys = [[] for s in range(N_SENSORS)], [[] for s in range(N_SENSORS)]
+    for rx in range(4, sh.nrows):
+        x = sh.cell_value(rowx=rx, colx=0)
+        try:
+            x = float(x)
+        except ValueError:
+            continue
+        x = start_time + 0.001 * x
+        for s in range(N_SENSORS):
+            y = sh.cell_value(rowx=rx, colx=(1 + s))
+            try:
+                y = float(y)
+            except ValueError:
+                continue
+            xs[s].append(x)
+            ys[s].append(y)
+    result = ["Ok"]
+    for s in range(N_SENSORS):
+        result.append(np.array(xs[s]))
+        result.append(np.array(ys[s]))
+    return result
+
+
+def bench_lakeshore_parsing(n_rows=100000, legacy=False):
+    try:
+        import xlwt
+    except ImportError:
+        print("Lakeshore parsing benchmark is skipped: xlwt is required to write synthetic .xls files")
+        return {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "lakeshore.xls")
+        n_rows = write_synthetic_lakeshore_xls(filename, n_rows)
+        result, message = parse_lakeshore_xls(filename)
+        assert result.ok and len(result.ts) == n_rows
+        results = {"lakeshore_parsing.parse": best_time(lambda: parse_lakeshore_xls(filename)),
+                   # Common part of all implementations
+                   "lakeshore_parsing.xlrd_open": best_time(lambda: xlrd.open_workbook(filename).sheet_by_index(0))}
+        print("Lakeshore .xls with {} rows: {:.3f} s, of which xlrd workbook decoding {:.3f} s, {:.1f} MB".format(
+            n_rows, results["lakeshore_parsing.parse"], results["lakeshore_parsing.xlrd_open"], result.nbytes / 1e6))
+        if legacy:
+            expected = parse_lakeshore_cells(filename)
+            for s in range(N_SENSORS):
+                ts, ys = result.channel(s)
+                valid = ~np.isnan(ys)  # Former records had separate times of the valid readings of each sensor
+                assert np.array_equal(ys[valid], expected[2 + 2 * s].astype(ys.dtype))
+                assert np.allclose(ts[valid] % SECONDS_PER_DAY, expected[1 + 2 * s])  # Former times of day
+            t_cells = best_time(lambda: parse_lakeshore_cells(filename))
+            print("    cell-by-cell {:.3f} s, speedup x{:.1f}; list of arrays {:.1f} MB".format(
+                t_cells, t_cells / results["lakeshore_parsing.parse"], sum(a.nbytes for a in expected[1:]) / 1e6))
+    return results
+
+
+def write_synthetic_pressure_csv(filename, n_rows, n_malformed=10):
+    """Writes pressure logger file with one sample per second (over several days) and a few broken rows"""
+    rng = np.random.default_rng(0)
+    ps = rng.uniform(0.5, 1.5, n_rows)
+    broken = set(rng.choice(n_rows, n_malformed, replace=False)) if n_malformed else set()
+    start = datetime.datetime(2021, 1, 21)
+    with open(filename, "w", encoding="iso-8859-1") as file:
+        file.write("Pressure logger\n")
+        file.write("Pressure [bar];Status;Time\n")
+        for r in range(n_rows):
+            if r in broken:
+                file.write("Sensor error;;\n")
+                continue
+            t = start + datetime.timedelta(seconds=r)
+            file.write("{:.6E};0;{}\n".format(ps[r], t.strftime("%d.%m.%Y %H:%M:%S")).replace(".", ",", 1))
+
+
+def parse_pressure_lines(filename):
+    """Former line-by-line implementation of FileDialog.parse_pressure_file (for comparison)"""
+    xs, ys = [], []
+    with open(filename, "r", encoding="iso-8859-1") as file:
+        for line_n, line in enumerate(file):
+            if line_n < 2:
+                continue
+            values = line.replace(",", ".").split(';')
+            try:
+                p = float(values[0])
+                t = timestr_to_seconds(values[2].split(" ")[1])
+                if t is None:
+                    continue
+            except ValueError:
+                continue
+            xs.append(t)
+            ys.append(p)
+    return ["Ok", np.array(xs), np.array(ys)]
+
+
+def bench_pressure_parsing(n_rows=1000000, legacy=False):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "pressure.csv")
+        write_synthetic_pressure_csv(filename, n_rows)
+        result, message = parse_pressure_csv(filename)
+        results = {"pressure_parsing.parse": best_time(lambda: parse_pressure_csv(filename))}
+        print("Pressure .csv with {} rows: {:.3f} s ({})".format(n_rows, results["pressure_parsing.parse"], message))
+        if legacy:
+            expected = parse_pressure_lines(filename)
+            assert np.array_equal(result.ts % SECONDS_PER_DAY, expected[1])
+            assert np.array_equal(result.columns[0], expected[2].astype(result.columns[0].dtype))
+            t_lines = best_time(lambda: parse_pressure_lines(filename), repeat=1)
+            print("    line-by-line {:.3f} s, speedup x{:.1f}".format(t_lines, t_lines / results["pressure_parsing.parse"]))
+    return results
+
+
+def synthetic_lakeshore_record(n_points, t_start=1611237843.0, dt=1.0):
+    rng = np.random.default_rng(0)
+    ts = t_start + dt * np.arange(n_points)
+    return FileRecord("Ok", ts, to_columns(rng.uniform(20.0, 100.0, (N_SENSORS, n_points))))
+
+
+def bench_update_graphs(n_files=4, n_points=1000000, legacy=False):
+    """Offscreen MyWindow.update_graphs with n_files Lakeshore files of n_points per channel"""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication
+    from test_qt import MyWindow
+    app = QApplication.instance() or QApplication([])
+    win = MyWindow()
+    win.resize(1200, 800)
+    win.show()
+    win.plotRawCheckbox.setChecked(False)
+    win.plotTCheckbox.setChecked(True)
+    for f in range(n_files):
+        win.dia.data1["file" + str(f)] = synthetic_lakeshore_record(n_points, t_start=1611237843.0 + 1000.0 * f)
+
+    def update():
+        win.update_graphs()
+        app.processEvents()
+
+    def change_calibration():
+        win.calib_dia.data[1].R_offset += 0.01  # As after editing one channel in CalibrationDialog
+        update()
+
+    def toggle_temperature():  # Results for both units stay in the calibration cache
+        win.plotTCheckbox.setChecked(not win.plotTCheckbox.isChecked())
+        app.processEvents()
+
+    t_first = best_time(update, repeat=1)
+    t_same = best_time(update)
+    t_calib = best_time(change_calibration)
+    toggle_temperature()
+    toggle_temperature()
+    t_toggle = best_time(toggle_temperature)
+    print("update_graphs of {} files x {} channels x {} points: first {:.3f} s, unchanged {:.4f} s, "
+          "one channel recalibrated {:.3f} s, R/T switched back {:.3f} s".format(
+              n_files, N_SENSORS, n_points, t_first, t_same, t_calib, t_toggle))
+    win.close()
+    return {"update_graphs.first": t_first, "update_graphs.unchanged": t_same,
+            "update_graphs.recalibrated": t_calib, "update_graphs.toggle_cached": t_toggle}
+
+
+def tick_values_loop(minVal, maxVal, size):
+    """Former DateAxisItem.tickValues with while loops (for comparison)"""
+    maxMajSteps = int(size / 80)
+    dx = maxVal - minVal
+    majticks = []
+    dt = 1800 if dx > 7200 else 300 if dx > 1200 else 30 if dx > 120 else 5
+    tick = dt * (np.floor(minVal) // dt) + dt
+    while tick < maxVal:
+        majticks.append(tick)
+        tick += dt
+    L = len(majticks)
+    if L > maxMajSteps:
+        majticks = majticks[::int(np.ceil(float(L) / maxMajSteps))]
+    return [(dt, majticks)]
+
+
+def tick_strings_loop(values, scale, spacing):
+    """Former DateAxisItem.tickStrings (for comparison)"""
+    fmt = "{H:02d}:{M:02d}" if spacing >= 60 else "{H:02d}:{M:02d}:{S:02d}"
+    return [second_to_timestr(x, fmt) for x in values]
+
+
+def bench_axis_ticks(n_repaints=2000, legacy=False):
+    """Tick values and labels for a sequence of repaints while panning and zooming"""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication
+    from plot_utilities import DateAxisItem
+    app = QApplication.instance() or QApplication([])
+    axis = DateAxisItem(orientation='bottom')
+    rng = np.random.default_rng(0)
+    # Many repaints happen at the same zoom level with small shifts of the view
+    spans = rng.choice([60.0, 600.0, 3600.0, 86400.0, 604800.0], n_repaints)
+    starts = 1611237843.0 + np.cumsum(rng.uniform(0.0, 0.5, n_repaints)) * spans / 100
+    views = list(zip(starts.tolist(), (starts + spans).tolist()))
+
+    def repaint(tick_values, tick_strings):
+        for t0, t1 in views:
+            for spacing, values in tick_values(t0, t1, 1000):
+                tick_strings(values, 1, spacing)
+
+    results = {"axis_ticks.repaints": best_time(lambda: repaint(axis.tickValues, axis.tickStrings))}
+    print("Axis ticks for {} repaints: {:.4f} s".format(n_repaints, results["axis_ticks.repaints"]))
+    if legacy:
+        legacy_views = [(t0, t1) for t0, t1 in views if t1 - t0 <= 43200]  # Spans without date ticks
+        for t0, t1 in legacy_views:
+            assert tick_values_loop(t0, t1, 1000)[0][1] == axis.tickValues(t0, t1, 1000)[0][1]
+        views = legacy_views
+        t_loop = best_time(lambda: repaint(tick_values_loop, tick_strings_loop))
+        t_cached = best_time(lambda: repaint(axis.tickValues, axis.tickStrings))
+        print("    {} repaints without date ticks: loops {:.4f} s, closed form + cache {:.4f} s, speedup x{:.1f}".format(
+            len(views), t_loop, t_cached, t_loop / t_cached))
+    return results
+
+
+STARTUP_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+from PyQt5.QtWidgets import QApplication
+import test_qt
+imported = time.perf_counter()
+app = QApplication(sys.argv)
+win = test_qt.MyWindow()
+win.show()
+app.processEvents()
+print(imported - start, time.perf_counter() - start)
+"""
+
+
+def bench_startup(repeat=5):
+    """Import of the viewer and the first shown window in fresh processes, after the .ui cache is built"""
+    directory = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as settings:
+        env = dict(os.environ, QT_QPA_PLATFORM="offscreen", LAKESHORE_VIEWER_PROFILE="0",
+                   LAKESHORE_VIEWER_UI_CACHE=os.path.join(settings, "ui"),
+                   LAKESHORE_VIEWER_CONFIG=os.path.join(settings, "config"),
+                   LAKESHORE_VIEWER_CACHE=os.path.join(settings, "cache"))
+        times = []
+        for _ in range(repeat + 1):  # The first run compiles the .ui files
+            out = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], capture_output=True, text=True,
+                                 cwd=directory, env=env, check=True).stdout
+            times.append([float(x) for x in out.split()[-2:]])
+    results = {"startup.import": min(t[0] for t in times[1:]),
+               "startup.first_window": min(t[1] for t in times[1:])}
+    print("Startup: import {:.3f} s, first window {:.3f} s (first run with .ui compilation {:.3f} s)".format(
+        results["startup.import"], results["startup.first_window"], times[0][1]))
+    return results
+
+
+def revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Prints comparison with baseline results, returns names of regressed benchmarks"""
+    regressions = []
+    for name, t in sorted(results.items()):
+        if name not in baseline:
+            continue
+        t_old = baseline[name]
+        slower = t > t_old * (1.0 + threshold) and t - t_old > MIN_REGRESSION
+        print("{:35s} {:10.4f} s {:10.4f} s {:+7.1f}%{}".format(
+            name, t_old, t, 100.0 * (t / t_old - 1.0) if t_old else 0.0, "  REGRESSION" if slower else ""))
+        if slower:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Timing benchmarks of the viewer on synthetic files")
+    parser.add_argument("-o", "--output", help="write results to this .json file")
+    parser.add_argument("-b", "--baseline", help="compare with results .json of another revision")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative slowdown (default 0.2)")
+    parser.add_argument("--only", nargs="*", help="run only these benchmarks")
+    parser.add_argument("--legacy", action="store_true", help="also time the former implementations")
+    parser.add_argument("--lakeshore-rows", type=int, default=XLS_MAX_ROWS - 4)
+    parser.add_argument("--pressure-rows", type=int, default=1000000)
+    parser.add_argument("--calibration-points", type=int, default=200000)
+    parser.add_argument("--files", type=int, default=4, help="files for update_graphs")
+    parser.add_argument("--points", type=int, default=1000000, help="points per channel for update_graphs")
+    parser.add_argument("--repaints", type=int, default=2000, help="repaints for axis_ticks")
+    args = parser.parse_args(argv)
+
+    benchmarks = {
+        "calibration": lambda: bench_calibration(args.calibration_points, args.legacy),
+        "lakeshore_parsing": lambda: bench_lakeshore_parsing(args.lakeshore_rows, args.legacy),
+        "pressure_parsing": lambda: bench_pressure_parsing(args.pressure_rows, args.legacy),
+        "update_graphs": lambda: bench_update_graphs(args.files, args.points, args.legacy),
+        "axis_ticks": lambda: bench_axis_ticks(args.repaints, args.legacy),
+        "startup": lambda: bench_startup(),
+    }
+    for name in args.only or []:
+        if name not in benchmarks:
+            parser.error("unknown benchmark '" + name + "', available: " + ", ".join(benchmarks))
+    results = {}
+    for name, bench in benchmarks.items():
+        if not args.only or name in args.only:
+            results.update(bench())
+
+    info = {"revision": revision(), "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+            "parameters": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "only")}}
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"info": info, "results": results}, file, indent=1)
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            baseline = json.load(file)
+        sizes = {k: v for k, v in info["parameters"].items() if k not in ("threshold", "legacy")}
+        if any(baseline["info"].get("parameters", {}).get(k) != v for k, v in sizes.items()):
+            print("Warning: baseline was run with different sizes:", baseline["info"].get("parameters"))
+        print("Compared with revision", baseline["info"].get("revision"), "(threshold {:.0%}):".format(args.threshold))
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            print(len(regressions), "benchmarks are slower than the baseline")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
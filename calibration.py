@@ -0,0 +1,215 @@
+"""
+Calibration of Lakeshore channels: conversion of the values in the file
+(Ohms or Kelvins) to resistance and temperature. Qt-independent.
+Calibration of all channels (a profile) can be saved to and loaded from JSON file:
+{"version": 2, "channels": [{"useOhms": true, "R_offset": 0.0, "R_scale": 1.0,
+"X1": null, "X2": null, "T1": null, "T2": null, "curve": "Pt100_curve.dat"}, ...]}
+"curve" is a curve file or builtin curve name (see calibration_curves), values out of
+the curve range are calibrated to NaN.
+The last used profile is kept in LAST_PROFILE to be restored on the next start.
+"""
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+import numpy as np
+import profiling
+from calibration_curves import DEFAULT_CURVE, get_curve
+
+CALIBRATION_FORMAT_VERSION = 2
+PROFILE_DIR = os.environ.get("LAKESHORE_VIEWER_CONFIG",
+                             os.path.join(os.path.expanduser("~"), ".config", "LakeshoreViewer"))
+LAST_PROFILE = os.path.join(PROFILE_DIR, "last_calibration.json")
+CALIBRATION_CACHE_SIZE = 512 * 1024 ** 2  # bytes
+
+
+class ChannelCalibration:
+    def __init__(self, curve_file=DEFAULT_CURVE):
+        self.useOhms = True
+        self.R_offset = 0.0
+        self.R_scale = 1.0
+        # Reference points (can recalibrate using only single one)
+        self.X1 = None
+        self.X2 = None
+        self.T1 = None
+        self.T2 = None
+
+        self.set_curve(curve_file)
+
+    def set_curve(self, curve_file):
+        """Raises OSError or ValueError for bad curve file"""
+        self.curve = get_curve(curve_file)  # Shared between all channels
+        self.curve_file = curve_file
+
+    def getCurveR(self, T):
+        return self.curve.getR(T)
+
+    def getCurveT(self, R):
+        return self.curve.getT(R)
+
+    def evaluateR(self, file_value):
+        if self.useOhms:
+            return (file_value + self.R_offset) * self.R_scale
+        R = self.getCurveR(file_value)
+        return (R + self.R_offset) * self.R_scale
+
+    def evaluateT(self, file_value):
+        return self.getCurveT(self.evaluateR(file_value))
+
+    def parameters(self):
+        """Everything calibrated values depend on"""
+        return self.useOhms, float(self.R_offset), float(self.R_scale), self.curve.digest
+
+    def parametersHash(self):
+        """parameters() as a string which is the same in every run of the program"""
+        return hashlib.sha1(json.dumps(self.parameters()).encode("utf-8")).hexdigest()
+
+    def evaluateArray(self, toT, file_values):
+        """Vectorized evaluateR/evaluateT over the whole channel in a single pass"""
+        vals = np.asarray(file_values, dtype=np.float64)
+        with profiling.stage("calibration", len(vals)):
+            if self.useOhms:
+                R = vals + self.R_offset
+            else:
+                R = self.getCurveR(vals) + self.R_offset
+            R *= self.R_scale
+            if toT:
+                R = self.getCurveT(R)
+        return R
+
+    def __calibrateBy1Point(self, x, T):
+        self.R_scale = 1.0
+        if self.useOhms:
+            self.R_offset = self.getCurveR(T) - x
+        else:
+            self.R_offset = self.getCurveR(T) - self.getCurveR(x)
+
+    def calibrateByPoints(self):
+        """Raises ValueError if a reference point is out of the curve range"""
+        offset, scale = self.R_offset, self.R_scale
+        self.__calibrateByPoints()
+        if not (np.isfinite(self.R_offset) and np.isfinite(self.R_scale)):
+            self.R_offset, self.R_scale = offset, scale
+            raise ValueError("Reference point is out of the calibration curve range")
+
+    def __calibrateByPoints(self):
+        if (self.X1 is None or self.T1 is None) and (self.X2 is None or self.T2 is None):
+            self.R_offset = 0.0
+            self.R_scale = 1.0
+            return
+        if not(self.X1 is None or self.T1 is None) and not(self.X2 is None or self.T2 is None):
+            if (self.X1 == self.X2) or (self.T1 == self.T2):
+                self.__calibrateBy1Point(self.X1, self.T1)
+                return
+            R1 = self.X1
+            R2 = self.X2
+            if not self.useOhms:
+                R1 = self.getCurveR(self.X1)
+                R2 = self.getCurveR(self.X2)
+            RT1 = self.getCurveR(self.T1)
+            RT2 = self.getCurveR(self.T2)
+            self.R_scale = (RT1 - RT2) / (R1 - R2)
+            self.R_offset = RT1 - self.R_scale * R1  # == RT2 - self.R_scale * R2
+            return
+        if not(self.X1 is None) and not(self.T1 is None):
+            self.__calibrateBy1Point(self.X1, self.T1)
+            return
+        if not(self.X2 is None) and not(self.T2 is None):
+            self.__calibrateBy1Point(self.X2, self.T2)
+            return
+
+    def toDict(self):
+        return {"useOhms": self.useOhms, "R_offset": float(self.R_offset), "R_scale": float(self.R_scale),
+                "X1": self.X1, "X2": self.X2, "T1": self.T1, "T2": self.T2, "curve": self.curve_file}
+
+    @staticmethod
+    def fromDict(values):
+        calibration = ChannelCalibration(values.get("curve", DEFAULT_CURVE))
+        calibration.useOhms = bool(values["useOhms"])
+        calibration.R_offset = float(values["R_offset"])
+        calibration.R_scale = float(values["R_scale"])
+        for field in ("X1", "X2", "T1", "T2"):
+            setattr(calibration, field, values.get(field))
+        return calibration
+
+
+def save_calibration(filename, channels):
+    """The file is replaced only after it is completely written"""
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "w") as file:
+        json.dump({"version": CALIBRATION_FORMAT_VERSION, "channels": [c.toDict() for c in channels]},
+                  file, indent=1)
+    os.replace(tmp_filename, filename)
+
+
+def load_calibration(filename):
+    """Returns list of ChannelCalibration. Raises OSError or ValueError for bad file"""
+    with open(filename, "r") as file:
+        values = json.load(file)
+    try:
+        if values["version"] > CALIBRATION_FORMAT_VERSION:
+            raise ValueError("Calibration file '" + filename + "' is written by newer version")
+        return [ChannelCalibration.fromDict(c) for c in values["channels"]]
+    except (KeyError, TypeError) as err:
+        raise ValueError("Invalid calibration file '" + filename + "': " + str(err))
+
+
+def save_last_profile(channels):
+    """Errors are printed only, the profile is a convenience"""
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        save_calibration(LAST_PROFILE, channels)
+    except OSError as err:
+        print("Error while saving calibration profile '", LAST_PROFILE, "':", err)
+
+
+def load_last_profile():
+    """Calibration saved by save_last_profile() or None"""
+    if not os.path.exists(LAST_PROFILE):
+        return None
+    try:
+        return load_calibration(LAST_PROFILE)
+    except (OSError, ValueError) as err:
+        print("Error while loading calibration profile '", LAST_PROFILE, "':", err)
+        return None
+
+
+class CalibrationCache:
+    """
+    Least recently used cache of calibration results (objects with nbytes, e.g. arrays or
+    MinMaxPyramid) bounded by their total size. Keys are tuples (source, channel, ...),
+    which should include ChannelCalibration.parameters().
+    """
+    def __init__(self, max_bytes=CALIBRATION_CACHE_SIZE):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()  # {key: value}, least recently used first
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, compute):
+        """Cached value or compute() which is then cached"""
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+            return value
+        value = compute()
+        self._entries[key] = value
+        self.nbytes += value.nbytes
+        while self.nbytes > self.max_bytes and len(self._entries) > 1:
+            self.nbytes -= self._entries.popitem(last=False)[1].nbytes
+        return value
+
+    def peek(self, key):
+        """Cached value or None, the order of use is not changed"""
+        return self._entries.get(key)
+
+    def invalidate(self, channel):
+        """Drops all results of the channel (e.g. after its parameters changed)"""
+        self.discard(lambda key: key[1] == channel)
+
+    def discard(self, predicate):
+        for key in [k for k in self._entries if predicate(k)]:
+            self.nbytes -= self._entries.pop(key).nbytes
@@ -0,0 +1,266 @@
+"""Registry of sensor calibration curves shared by all ChannelCalibration instances.
+Each curve is loaded only once per process. Curves are:
+- tables of T and sensor units: two column text files ("*.dat", "//T[k]  R[Ohm]" header)
+  and Lakeshore curve files ("*.340"), interpolated by monotone cubic splines,
+- Callendar-Van Dusen equation of IEC 60751 platinum sensors ("CVD Pt100", "CVD Pt1000").
+All evaluators are vectorized over arrays and return NaN outside of the curve range.
+The parsed .dat table is also cached in binary form next to the text file ("<name>.npy")."""
+
+import glob
+import hashlib
+import os
+import numpy as np
+
+PACKAGE_DIR = os.path.dirname(os.path.realpath(__file__))
+DEFAULT_CURVE = "Pt100_curve.dat"
+CURVE_EXTENSIONS = (".dat", ".340")
+CVD_CURVES = {"CVD Pt100": 100.0, "CVD Pt1000": 1000.0}  # {name: R0 in Ohms}
+# IEC 60751 coefficients, valid from -200 to 850 C
+CVD_A = 3.9083e-3
+CVD_B = -5.775e-7
+CVD_C = -4.183e-12
+ZERO_CELSIUS = 273.15
+
+_curves = {}  # {absolute path or builtin name: curve}
+
+
+def resolve_curve_path(filename):
+    """Relative paths are resolved relative to the package, not the working directory"""
+    if os.path.isabs(filename):
+        return filename
+    return os.path.join(PACKAGE_DIR, filename)
+
+
+def available_curves():
+    """Names of the builtin curves and curve files in the package directory"""
+    files = sorted(os.path.basename(fn) for ext in CURVE_EXTENSIONS
+                   for fn in glob.glob(os.path.join(PACKAGE_DIR, "*" + ext)))
+    return files + list(CVD_CURVES)
+
+
+def load_curve_table(path):
+    """Returns [[T, R], ...] array from text file, using binary cache when it is up to date"""
+    cache_path = path + ".npy"
+    try:
+        if os.path.getmtime(cache_path) >= os.path.getmtime(path):
+            return np.load(cache_path)
+    except OSError:
+        pass
+    table = np.loadtxt(path, skiprows=1)
+    try:
+        np.save(cache_path, table)
+    except OSError:  # Read-only installation, just don't cache
+        pass
+    return table
+
+
+def load_340(path):
+    """
+    Lakeshore .340 curve file. Returns (T, units, is_log), where units are
+    log10(Ohm) for data format 4, otherwise mV, V or Ohm as written in the file.
+    Raises ValueError for unsupported data format or file without breakpoints.
+    """
+    data_format = 3
+    ts, units = [], []
+    with open(path, "r", errors="replace") as file:
+        for line in file:
+            key, sep, value = line.partition(":")
+            if sep and key.strip().lower() == "data format":
+                data_format = int(value.split()[0])
+                continue
+            tokens = line.split()
+            if len(tokens) >= 3 and tokens[0].isdigit():  # No.  Units  Temperature (K)
+                units.append(float(tokens[1]))
+                ts.append(float(tokens[2]))
+    if data_format not in (1, 2, 3, 4):
+        raise ValueError("Unsupported data format " + str(data_format) + " of curve '" + path + "'")
+    if len(ts) < 2:
+        raise ValueError("No breakpoints in curve '" + path + "'")
+    return np.array(ts), np.array(units), data_format == 4
+
+
+class MonotoneSpline:
+    """
+    Piecewise cubic Hermite interpolation with Fritsch-Carlson slopes (same as PCHIP):
+    it does not overshoot, so that monotone tables give monotone curves.
+    """
+    def __init__(self, xs, ys):
+        order = np.argsort(xs)
+        self.xs = xs = np.asarray(xs, dtype=np.float64)[order]
+        self.ys = ys = np.asarray(ys, dtype=np.float64)[order]
+        h = np.diff(xs)
+        if np.any(h <= 0):
+            raise ValueError("Curve points must have distinct values")
+        delta = np.diff(ys) / h
+        d = np.empty(len(xs))
+        if len(xs) == 2:
+            d[:] = delta[0]
+        else:
+            w1 = 2 * h[1:] + h[:-1]
+            w2 = h[1:] + 2 * h[:-1]
+            same_sign = delta[:-1] * delta[1:] > 0
+            with np.errstate(divide='ignore', invalid='ignore'):
+                d[1:-1] = np.where(same_sign, (w1 + w2) / (w1 / delta[:-1] + w2 / delta[1:]), 0.0)
+            d[0] = self._end_slope(h[0], h[1], delta[0], delta[1])
+            d[-1] = self._end_slope(h[-1], h[-2], delta[-1], delta[-2])
+        self.h = h
+        self.c1 = d[:-1]
+        self.c2 = (3 * delta - 2 * d[:-1] - d[1:]) / h
+        self.c3 = (d[:-1] + d[1:] - 2 * delta) / h ** 2
+
+    @staticmethod
+    def _end_slope(h0, h1, delta0, delta1):
+        d = ((2 * h0 + h1) * delta0 - h0 * delta1) / (h0 + h1)
+        if np.sign(d) != np.sign(delta0):
+            return 0.0
+        if np.sign(delta0) != np.sign(delta1) and abs(d) > abs(3 * delta0):
+            return 3 * delta0
+        return d
+
+    def _locate(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        i = np.clip(np.searchsorted(self.xs, x, side='right') - 1, 0, len(self.h) - 1)
+        return x, i, x - self.xs[i]
+
+    def __call__(self, x):
+        x, i, t = self._locate(x)
+        out = self.ys[i] + t * (self.c1[i] + t * (self.c2[i] + t * self.c3[i]))
+        return np.where((x < self.xs[0]) | (x > self.xs[-1]), np.nan, out)
+
+    def derivative(self, x):
+        x, i, t = self._locate(x)
+        return self.c1[i] + t * (2 * self.c2[i] + 3 * t * self.c3[i])
+
+
+class UniformTable:
+    """
+    Smooth function y(x) precomputed with its derivative onto a uniform grid and evaluated by
+    cubic Hermite interpolation between grid points, so that the lookup is an O(1) index
+    computation instead of a binary search. Values outside of the range are NaN.
+    """
+    def __init__(self, function, derivative, x_min, x_max, n_points=4096):
+        self.x_min = float(x_min)
+        self.x_max = float(x_max)
+        self.n_points = n_points
+        self.step = (self.x_max - self.x_min) / (n_points - 1)
+        self.inv_step = 1.0 / self.step
+        grid = np.linspace(self.x_min, self.x_max, n_points)
+        values = function(grid)
+        slopes = derivative(grid) * self.step  # Per grid step
+        delta = np.diff(values)
+        self.c0 = values[:-1]
+        self.c1 = slopes[:-1]
+        self.c2 = 3 * delta - 2 * slopes[:-1] - slopes[1:]
+        self.c3 = slopes[:-1] + slopes[1:] - 2 * delta
+
+    def __call__(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        pos = (x - self.x_min) * self.inv_step
+        with np.errstate(invalid='ignore'):  # NaNs are passed through
+            idx = np.clip(pos.astype(np.intp), 0, self.n_points - 2)
+            t = pos - idx
+            out = self.c0[idx] + t * (self.c1[idx] + t * (self.c2[idx] + t * self.c3[idx]))
+            out = np.where((x < self.x_min) | (x > self.x_max), np.nan, out)
+        if out.ndim == 0:
+            return float(out)
+        return out
+
+
+def file_digest(path):
+    with open(path, "rb") as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+
+class CalibrationCurve:
+    """
+    Table of T and sensor units, interpolated in log10 of the units if is_log.
+    digest identifies the curve values (e.g. hash of the file contents).
+    """
+    def __init__(self, path, T, units, is_log=False, digest=None):
+        self.path = path
+        self.digest = digest or path
+        self.is_log = is_log
+        self.T = np.asarray(T, dtype=np.float64)
+        self.R = 10 ** np.asarray(units, dtype=np.float64) if is_log else np.asarray(units, dtype=np.float64)
+        TR = MonotoneSpline(T, units)
+        RT = MonotoneSpline(units, T)
+        self.TR_table = UniformTable(TR, TR.derivative, TR.xs[0], TR.xs[-1])
+        self.RT_table = UniformTable(RT, RT.derivative, RT.xs[0], RT.xs[-1])
+
+    @staticmethod
+    def from_file(path):
+        digest = file_digest(path)
+        if path.lower().endswith(".340"):
+            return CalibrationCurve(path, *load_340(path), digest=digest)
+        table = load_curve_table(path)
+        return CalibrationCurve(path, table[:, 0], table[:, 1], digest=digest)
+
+    def getR(self, T):
+        units = self.TR_table(T)
+        return 10 ** units if self.is_log else units
+
+    def getT(self, R):
+        if self.is_log:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                R = np.log10(R)
+        return self.RT_table(R)
+
+
+class CallendarVanDusenCurve:
+    """R(T) = R0 (1 + A t + B t^2 + C (t - 100) t^3), t in Celsius, C = 0 above 0 C"""
+    def __init__(self, name, R0):
+        self.path = name
+        self.digest = "CVD {} {} {} {}".format(R0, CVD_A, CVD_B, CVD_C)
+        self.R0 = R0
+        self.T_min = ZERO_CELSIUS - 200.0
+        self.T_max = ZERO_CELSIUS + 850.0
+        self.RT_table = UniformTable(self._inverse, lambda R: 1.0 / self._derivative(self._inverse(R)),
+                                     self._R(self.T_min), self._R(self.T_max))
+
+    def _R(self, T):
+        t = np.asarray(T, dtype=np.float64) - ZERO_CELSIUS
+        c = np.where(t < 0, CVD_C, 0.0)
+        return self.R0 * (1 + t * (CVD_A + t * CVD_B) + c * (t - 100) * t ** 3)
+
+    def _derivative(self, T):
+        t = np.asarray(T, dtype=np.float64) - ZERO_CELSIUS
+        c = np.where(t < 0, CVD_C, 0.0)
+        return self.R0 * (CVD_A + 2 * CVD_B * t + c * (4 * t - 300) * t ** 2)
+
+    def _inverse(self, R):
+        """Exact above 0 C, Newton iterations from the quadratic solution below"""
+        R = np.asarray(R, dtype=np.float64)
+        T = ZERO_CELSIUS + (-CVD_A + np.sqrt(CVD_A ** 2 - 4 * CVD_B * (1 - R / self.R0))) / (2 * CVD_B)
+        below = R < self.R0
+        for _ in range(6):
+            T = np.where(below, T - (self._R(T) - R) / self._derivative(T), T)
+        return T
+
+    def getR(self, T):
+        T = np.asarray(T, dtype=np.float64)
+        out = np.where((T < self.T_min) | (T > self.T_max), np.nan, self._R(T))
+        if out.ndim == 0:
+            return float(out)
+        return out
+
+    def getT(self, R):
+        return self.RT_table(R)
+
+
+def get_curve(filename=DEFAULT_CURVE):
+    """
+    Returns shared curve for the file or builtin curve name, loading it on the first request.
+    Raises OSError or ValueError for bad curve file.
+    """
+    if filename in CVD_CURVES:
+        path = filename
+    else:
+        path = os.path.normpath(resolve_curve_path(filename))
+    curve = _curves.get(path)
+    if curve is None:
+        if filename in CVD_CURVES:
+            curve = CallendarVanDusenCurve(filename, CVD_CURVES[filename])
+        else:
+            curve = CalibrationCurve.from_file(path)
+        _curves[path] = curve
+    return curve
@@ -0,0 +1,127 @@
+"""
+Compact storage of loaded files. Qt-independent.
+FileRecord keeps one float64 time column shared by all channels of the file and
+a float32 value column per channel, NaN marks a missing sample of a channel.
+ChannelStore is {filename: FileRecord} with O(1) snapshots (copy on write), so that
+dialogs can keep temporary data and accept or reject it without copying.
+"""
+
+import os
+import numpy as np
+
+VALUE_DTYPE = np.float32
+
+
+class FileRecord:
+    __slots__ = ("status", "ts", "columns")
+
+    def __init__(self, status, ts=None, columns=()):
+        self.status = status  # "Ok" or "Failed"
+        self.ts = np.array([]) if ts is None else ts
+        self.columns = list(columns)
+
+    @staticmethod
+    def failed():
+        return FileRecord("Failed")
+
+    @property
+    def ok(self):
+        return self.status == "Ok"
+
+    @property
+    def n_channels(self):
+        return len(self.columns)
+
+    def channel(self, c):
+        """(ts, ys) of channel c without copying, ys may contain NaN"""
+        return self.ts, self.columns[c]
+
+    @property
+    def nbytes(self):
+        return self.ts.nbytes + sum(ys.nbytes for ys in self.columns)
+
+
+def to_columns(columns):
+    """Converts value columns to VALUE_DTYPE (no copy if they already are)"""
+    return [np.asarray(ys, dtype=VALUE_DTYPE) for ys in columns]
+
+
+class ChannelStore:
+    """
+    {filename: FileRecord} mapping. snapshot() shares the records with the copy,
+    the mapping is copied only by the first modification of either of them.
+    """
+    __slots__ = ("_records", "_owned")
+
+    def __init__(self):
+        self._records = {}
+        self._owned = True
+
+    def snapshot(self):
+        other = ChannelStore()
+        other._records = self._records
+        other._owned = False
+        self._owned = False
+        return other
+
+    def _own(self):
+        if not self._owned:
+            self._records = dict(self._records)
+            self._owned = True
+
+    def __setitem__(self, filename, record):
+        self._own()
+        self._records[filename] = record
+
+    def __delitem__(self, filename):
+        self._own()
+        del self._records[filename]
+
+    def __getitem__(self, filename):
+        return self._records[filename]
+
+    def __contains__(self, filename):
+        return filename in self._records
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def get(self, filename, default=None):
+        return self._records.get(filename, default)
+
+    def items(self):
+        return self._records.items()
+
+    def keys(self):
+        return self._records.keys()
+
+    def values(self):
+        return self._records.values()
+
+    @property
+    def nbytes(self):
+        return sum(record.nbytes for record in self._records.values())
+
+
+def load_array(path):
+    """Memory-mapped .npy file"""
+    try:
+        return np.load(path, mmap_mode="r")
+    except ValueError:  # Empty arrays can't be memory-mapped
+        return np.load(path)
+
+
+def save_record(directory, record):
+    """Writes arrays of the record as .npy files into existing directory"""
+    np.save(os.path.join(directory, "t.npy"), np.asarray(record.ts))
+    for i, ys in enumerate(record.columns):
+        np.save(os.path.join(directory, str(i) + ".npy"), np.asarray(ys))
+
+
+def load_record(directory, status, n_columns):
+    """FileRecord of memory-mapped arrays written by save_record"""
+    ts = load_array(os.path.join(directory, "t.npy"))
+    return FileRecord(status, ts, [load_array(os.path.join(directory, str(i) + ".npy")) for i in range(n_columns)])
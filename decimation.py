@@ -0,0 +1,104 @@
+"""
+Min/max preserving level-of-detail pyramid for plotting long series.
+Each level merges LOD_FACTOR bins of the previous level and keeps minimum and
+maximum of every bin, so that spikes stay visible at any zoom.
+"""
+
+import numpy as np
+
+LOD_FACTOR = 4
+MIN_LEVEL_SIZE = 512  # bins, coarser levels are not built
+POINTS_PER_PIXEL = 2
+
+
+def _reduce_bins(ts, mins, maxs):
+    """Merges each LOD_FACTOR consecutive bins, the last bin may be incomplete"""
+    pad = -len(mins) % LOD_FACTOR
+    if pad:
+        mins = np.concatenate((mins, np.full(pad, np.nan, dtype=mins.dtype)))
+        maxs = np.concatenate((maxs, np.full(pad, np.nan, dtype=maxs.dtype)))
+    mins = np.fmin.reduce(mins.reshape(-1, LOD_FACTOR), axis=1)  # fmin/fmax ignore NaNs
+    maxs = np.fmax.reduce(maxs.reshape(-1, LOD_FACTOR), axis=1)
+    return ts[::LOD_FACTOR], mins, maxs
+
+
+class MinMaxPyramid:
+    def __init__(self, ts, ys):
+        self.ts = np.asarray(ts)
+        self.ys = np.asarray(ys)
+        self.levels = []  # [(bin start times, bin minimums, bin maximums)], finest first
+        # Range queries require sorted time. Unsorted data is always plotted in full.
+        self.is_sorted = len(self.ts) < 2 or bool(np.all(self.ts[1:] >= self.ts[:-1]))
+        if not self.is_sorted:
+            return
+        level = (self.ts, self.ys, self.ys)
+        while len(level[0]) > MIN_LEVEL_SIZE * LOD_FACTOR:
+            level = _reduce_bins(*level)
+            self.levels.append(level)
+
+    @staticmethod
+    def from_levels(ts, ys, levels):
+        """Pyramid of sorted data with levels built before (e.g. memory-mapped from a session)"""
+        pyramid = MinMaxPyramid.__new__(MinMaxPyramid)
+        pyramid.ts = ts
+        pyramid.ys = ys
+        pyramid.levels = levels
+        pyramid.is_sorted = True
+        return pyramid
+
+    def __len__(self):
+        return len(self.ts)
+
+    @property
+    def nbytes(self):
+        """Size of values and levels (times are usually shared with the source data)"""
+        return self.ys.nbytes + sum(mins.nbytes + maxs.nbytes for ts, mins, maxs in self.levels)
+
+    def query(self, t0, t1, n_pixels):
+        """
+        Returns (xs, ys) to plot [t0, t1] range at n_pixels width: raw samples if there
+        are few of them or min/max pairs of the level with about POINTS_PER_PIXEL points per pixel.
+        First and last samples are always included, so that plot data bounds do not depend on the view.
+        """
+        if not self.is_sorted or len(self.ts) < 2:
+            return self.ts, self.ys
+        max_points = max(int(n_pixels), 1) * POINTS_PER_PIXEL
+        i0, i1 = self._slice(self.ts, t0, t1)
+        if i1 - i0 <= max_points or not self.levels:
+            return self._with_ends(self.ts[i0:i1], self.ys[i0:i1])
+        for ts, mins, maxs in self.levels:  # Coarsest level is used if none is small enough
+            i0, i1 = self._slice(ts, t0, t1)
+            if (i1 - i0) * 2 <= max_points:
+                break
+        xs = np.repeat(ts[i0:i1], 2)
+        ys = np.empty(len(xs), dtype=mins.dtype)
+        ys[0::2] = mins[i0:i1]
+        ys[1::2] = maxs[i0:i1]
+        return self._with_ends(xs, ys)
+
+    def nearest(self, t):
+        """Index of the sample nearest to t, None for empty or unsorted data"""
+        n = len(self.ts)
+        if not n or not self.is_sorted:
+            return None
+        i = int(np.searchsorted(self.ts, t))
+        if i == n or (i > 0 and t - self.ts[i - 1] <= self.ts[i] - t):
+            return i - 1
+        return i
+
+    @staticmethod
+    def _slice(ts, t0, t1):
+        """Indices of the samples inside [t0, t1] plus one sample on each side"""
+        i0 = max(int(np.searchsorted(ts, t0, side='right')) - 1, 0)
+        i1 = min(int(np.searchsorted(ts, t1, side='left')) + 1, len(ts))
+        return i0, i1
+
+    def _with_ends(self, xs, ys):
+        """Bins of coarse levels start at their first sample, so the last sample is added even for the last bin"""
+        if not len(xs) or xs[0] > self.ts[0]:
+            xs = np.concatenate((self.ts[:1], xs))
+            ys = np.concatenate((self.ys[:1], ys))
+        if xs[-1] < self.ts[-1]:
+            xs = np.concatenate((xs, self.ts[-1:]))
+            ys = np.concatenate((ys, self.ys[-1:]))
+        return xs, ys
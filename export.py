@@ -0,0 +1,107 @@
+"""
+Writers of tables produced chunk by chunk (e.g. by timebase.merge), so that
+the whole table never has to be in memory. Qt-independent.
+Chunks are (ts, [column values]), the first column of the output is time in seconds since epoch
+(see time_utilities). Parquet is written only if pyarrow is installed.
+"""
+
+import importlib.util
+import os
+import zipfile
+import numpy as np
+
+EXPORT_FORMATS = (".csv", ".npy", ".npz") + ((".parquet",) if importlib.util.find_spec("pyarrow") else ())
+
+
+class ExportCancelled(Exception):
+    """Raised by the chunk source to stop writing, the incomplete file is removed"""
+
+
+def write_csv(filename, names, chunks, delimiter=";"):
+    """Returns number of written rows"""
+    n_rows = 0
+    with open(filename, "w") as file:
+        file.write(delimiter.join(["time"] + list(names)) + "\n")
+        for ts, columns in chunks:
+            np.savetxt(file, np.column_stack([ts] + list(columns)), fmt=["%.3f"] + ["%.9g"] * len(columns),
+                       delimiter=delimiter)
+            n_rows += len(ts)
+    return n_rows
+
+
+def write_npy(filename, names, chunks, n_rows):
+    """
+    Writes (n_rows, 1 + len(names)) float64 array through memory mapping.
+    Column names are written to <filename>.columns.txt. Returns number of written rows
+    """
+    table = np.lib.format.open_memmap(filename, mode="w+", dtype=np.float64, shape=(n_rows, 1 + len(names)))
+    pos = 0
+    for ts, columns in chunks:
+        table[pos:pos + len(ts), 0] = ts
+        for c, values in enumerate(columns):
+            table[pos:pos + len(ts), 1 + c] = values
+        pos += len(ts)
+    table.flush()
+    del table
+    with open(filename + ".columns.txt", "w") as file:
+        file.write("\n".join(["time"] + list(names)) + "\n")
+    return pos
+
+
+def write_npz(filename, names, chunks, n_rows):
+    """
+    Compressed archive of "table" (n_rows, 1 + len(names)) float64 array, which is streamed
+    row by row into the zip member, and "columns" array of the column names.
+    Returns number of written rows
+    """
+    pos = 0
+    with zipfile.ZipFile(filename, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+        with archive.open("columns.npy", "w") as member:
+            np.lib.format.write_array(member, np.array(["time"] + list(names)))
+        with archive.open("table.npy", "w", force_zip64=True) as member:
+            header = {"descr": np.lib.format.dtype_to_descr(np.dtype(np.float64)), "fortran_order": False,
+                      "shape": (n_rows, 1 + len(names))}
+            np.lib.format.write_array_header_2_0(member, header)
+            for ts, columns in chunks:
+                if pos + len(ts) > n_rows:
+                    raise ValueError("More rows than expected")
+                member.write(np.ascontiguousarray(np.column_stack([ts] + list(columns)), dtype=np.float64).data)
+                pos += len(ts)
+            if pos != n_rows:
+                raise ValueError("Fewer rows than expected")
+    return pos
+
+
+def write_parquet(filename, names, chunks):
+    """Every chunk is written as a row group. Returns number of written rows"""
+    import pyarrow
+    import pyarrow.parquet
+    schema = pyarrow.schema([("time", pyarrow.float64())] + [(name, pyarrow.float64()) for name in names])
+    n_rows = 0
+    with pyarrow.parquet.ParquetWriter(filename, schema) as writer:
+        for ts, columns in chunks:
+            arrays = [pyarrow.array(np.asarray(ts, dtype=np.float64))] + \
+                     [pyarrow.array(np.asarray(values, dtype=np.float64)) for values in columns]
+            writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+            n_rows += len(ts)
+    return n_rows
+
+
+def write_table(filename, names, chunks, n_rows):
+    """Chooses the format by file extension. Incomplete file is removed if writing fails"""
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in EXPORT_FORMATS:
+        raise ValueError("Unsupported export format '" + ext + "', use one of " + ", ".join(EXPORT_FORMATS))
+    try:
+        if ext == ".csv":
+            return write_csv(filename, names, chunks)
+        if ext == ".npy":
+            return write_npy(filename, names, chunks, n_rows)
+        if ext == ".npz":
+            return write_npz(filename, names, chunks, n_rows)
+        return write_parquet(filename, names, chunks)
+    except BaseException:
+        for path in (filename, filename + ".columns.txt"):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
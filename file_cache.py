@@ -0,0 +1,111 @@
+"""
+On-disk cache of parsed files. Each successfully parsed file is stored as a
+directory of .npy arrays, which are memory-mapped on the next load instead of
+parsing the file again. Entries are keyed by absolute path, size, modification
+time and parser version and are evicted in least recently used order when the
+cache grows above MAX_CACHE_SIZE.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from channel_store import save_record, load_record
+
+CACHE_DIR = os.environ.get("LAKESHORE_VIEWER_CACHE",
+                           os.path.join(os.path.expanduser("~"), ".cache", "LakeshoreViewer", "parsed"))
+MAX_CACHE_SIZE = 2 * 1024 ** 3  # bytes
+_MANIFEST = "manifest.json"
+
+
+def cache_key(filename, parser_version):
+    path = os.path.abspath(filename)
+    st = os.stat(path)
+    key = "|".join([path, str(st.st_size), str(st.st_mtime_ns), parser_version])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def load(filename, parser_version):
+    """Returns cached parsing result (with memory-mapped arrays) or None"""
+    try:
+        entry = os.path.join(CACHE_DIR, cache_key(filename, parser_version))
+        with open(os.path.join(entry, _MANIFEST), "r") as file:
+            manifest = json.load(file)
+        result = load_record(entry, manifest["status"], manifest["n_columns"])
+        os.utime(entry)  # Recently used
+        return result
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def store(filename, parser_version, result, key=None):
+    """
+    Saves successful parsing result, errors are ignored (cache is optional).
+    key is cache_key() of the file taken before parsing, so that the result of a file
+    which grew while being parsed is not stored under its new size.
+    """
+    if not result.ok:
+        return
+    try:
+        entry = os.path.join(CACHE_DIR, key or cache_key(filename, parser_version))
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_entry = tempfile.mkdtemp(dir=CACHE_DIR, prefix=".tmp")
+        save_record(tmp_entry, result)
+        with open(os.path.join(tmp_entry, _MANIFEST), "w") as file:
+            json.dump({"filename": os.path.abspath(filename), "version": parser_version,
+                       "status": result.status, "n_columns": result.n_channels}, file)
+        try:
+            os.replace(tmp_entry, entry)  # Atomic, so that concurrent loads never see partial entry
+        except OSError:  # Already stored by another worker
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+        evict()
+    except OSError as err:
+        print("Failed to cache '", filename, "':", err)
+
+
+def _entries():
+    """[(last use time, size in bytes, path)] of all cache entries"""
+    entries = []
+    try:
+        names = os.listdir(CACHE_DIR)
+    except OSError:
+        return entries
+    for name in names:
+        if name.startswith(".tmp"):  # Being written
+            continue
+        path = os.path.join(CACHE_DIR, name)
+        try:
+            size = sum(f.stat().st_size for f in os.scandir(path))
+            entries.append((os.stat(path).st_mtime, size, path))
+        except OSError:
+            continue
+    return entries
+
+
+def evict(max_size=None):
+    """Removes least recently used entries until the cache fits into max_size"""
+    if max_size is None:
+        max_size = MAX_CACHE_SIZE
+    entries = sorted(_entries())
+    total = sum(e[1] for e in entries)
+    for used, size, path in entries:
+        if total <= max_size:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+
+def clear():
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+
+def cached_parse(parser, parser_version, filename):
+    """parser(filename) -> (result, message) which stores the result in cache. Can be run in worker process"""
+    try:
+        key = cache_key(filename, parser_version)
+    except OSError:  # Parser reports the error
+        return parser(filename)
+    result, message = parser(filename)
+    store(filename, parser_version, result, key)
+    return result, message
@@ -0,0 +1,206 @@
+"""
+Parsers of Lakeshore (.xls) and pressure (.csv) files. Qt-independent, so that
+they can be run in worker processes or without GUI.
+Each parser returns (result, message), where result is channel_store.FileRecord
+and message is a status line text.
+"""
+
+import sys
+import warnings
+import numpy as np
+import profiling
+from channel_store import FileRecord, to_columns
+from time_utilities import lakeshore_datestr_to_seconds, pressure_datestr_to_seconds, days_from_civil, SECONDS_PER_DAY
+
+N_SENSORS = 4
+# Must be changed whenever parsing result for the same file may change (invalidates file_cache)
+LAKESHORE_PARSER_VERSION = "lakeshore-3"
+PRESSURE_PARSER_VERSION = "pressure-3"
+LAKESHORE_FIRST_DATA_ROW = 4
+PRESSURE_HEADER_LINES = 2
+PRESSURE_CHUNK_SIZE = 1 << 22  # Bytes read and converted at once
+MAX_PRESSURE_FIELD_WIDTH = 32  # Longer fields are parsed line by line
+
+# xlrd.XL_CELL_* values, xlrd itself is imported only when the first .xls file is opened
+XL_CELL_TEXT = 1
+_NUMERIC_CELL_TYPES = (2, 3, 4)  # XL_CELL_NUMBER, XL_CELL_DATE, XL_CELL_BOOLEAN
+
+
+def column_to_float(sheet, colx, start_rowx):
+    """Reads the whole sheet column as float64 array. Cells which are not numbers become NaN"""
+    values = sheet.col_values(colx, start_rowx=start_rowx)
+    types = np.array(sheet.col_types(colx, start_rowx=start_rowx), dtype=np.int8)
+    numeric = np.isin(types, _NUMERIC_CELL_TYPES)
+    if numeric.all():
+        return np.array(values, dtype=np.float64)
+    out = np.full(len(values), np.nan)
+    out[numeric] = np.array(values, dtype=object)[numeric].astype(np.float64)
+    for i in np.flatnonzero(types == XL_CELL_TEXT):  # Numbers stored as text are rare
+        try:
+            out[i] = float(values[i])
+        except ValueError:
+            pass
+    return out
+
+
+def lakeshore_start_time(sheet):
+    """Seconds since epoch of the B2 cell ("Thu Jan 21 14:04:03 NOVT 2021")"""
+    start_time = lakeshore_datestr_to_seconds(sheet.cell_value(rowx=1, colx=1))
+    if start_time is None:
+        raise ValueError("Invalid start time")
+    return start_time
+
+
+def lakeshore_rows(sheet, start_time, start_rowx=LAKESHORE_FIRST_DATA_ROW):
+    """Returns (ts, [ys of each sensor]) of the sheet rows starting from start_rowx, NaN for invalid readings"""
+    ts = column_to_float(sheet, 0, start_rowx)  # in milliseconds
+    ts = start_time + 0.001 * ts  # in seconds
+    valid_rows = ~np.isnan(ts)
+    columns = [column_to_float(sheet, 1 + s, start_rowx)[valid_rows] for s in range(N_SENSORS)]
+    return ts[valid_rows], to_columns(columns)
+
+
+def parse_lakeshore_xls(filename):
+    import xlrd  # reading xls files
+    try:
+        with profiling.stage("parse.xlrd_open"):
+            book = xlrd.open_workbook(filename, on_demand=True)
+            sh = book.sheet_by_index(0)
+        start_time = lakeshore_start_time(sh)
+        if sh.nrows < LAKESHORE_FIRST_DATA_ROW + 1:
+            raise IndexError("Empty data")
+        with profiling.stage("parse.lakeshore_rows", sh.nrows - LAKESHORE_FIRST_DATA_ROW):
+            result = FileRecord("Ok", *lakeshore_rows(sh, start_time))
+        book.release_resources()
+        return result, "Loaded '" + filename + "'"
+
+    except:
+        print("Error while opening file '", filename, "':", sys.exc_info()[0])
+        return FileRecord.failed(), "Error for '" + filename + "'"
+
+
+def parse_pressure_line(line):
+    """Line-by-line parsing of the pressure file row. Returns (t, p) or None for malformed row"""
+    values = line.replace(",", ".").split(';')
+    try:
+        p = float(values[0])
+        t = pressure_datestr_to_seconds(values[2])
+    except (ValueError, IndexError):
+        return None
+    if t is None:
+        return None
+    return t, p
+
+
+_PRESSURE_CHARS = np.zeros(256, dtype=bool)  # Characters allowed in pressure value field
+_PRESSURE_CHARS[np.frombuffer(b"0123456789.,+-eE", dtype=np.uint8)] = True
+_DATETIME_OFFSETS = np.arange(-19, 0)  # "DD.MM.YYYY HH:MM:SS" is the whole time field
+_DATETIME_DIGITS = [0, 1, 3, 4, 6, 7, 8, 9, 11, 12, 14, 15, 17, 18]
+
+
+def parse_pressure_chunk(chunk):
+    """
+    Parses chunk (bytes) of complete lines with vectorized operations.
+    Rows which do not fit the usual "p;...;DD.MM.YYYY HH:MM:SS" layout are passed
+    to parse_pressure_line. Returns (ts, ps, number of skipped rows).
+    """
+    buf = np.frombuffer(chunk, dtype=np.uint8)
+    if buf[-1] != ord('\n'):  # Last line of the file
+        buf = np.append(buf, np.uint8(ord('\n')))
+    ends = np.flatnonzero(buf == ord('\n'))
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    stripped_ends = ends - (buf[ends - 1] == ord('\r'))
+    blank = stripped_ends <= starts
+
+    semis = np.concatenate((np.flatnonzero(buf == ord(';')), [len(buf)] * 3))
+    first = np.searchsorted(semis, starts)
+    sc1, sc2, sc3 = semis[first], semis[first + 1], semis[first + 2]
+    time_end = np.minimum(sc3, stripped_ends)
+    ok = ~blank & (sc1 > starts) & (sc2 < ends) & (time_end - 19 == sc2 + 1)
+
+    # Date and time of the third field are converted to seconds since epoch
+    chars = buf[np.clip(time_end[:, None] + _DATETIME_OFFSETS, 0, len(buf) - 1)].astype(np.int32)
+    digits = chars[:, _DATETIME_DIGITS] - ord('0')
+    ok &= (chars[:, 2] == ord('.')) & (chars[:, 5] == ord('.')) & (chars[:, 10] == ord(' ')) \
+        & (chars[:, 13] == ord(':')) & (chars[:, 16] == ord(':'))
+    ok &= np.all((digits >= 0) & (digits <= 9), axis=1)
+    day = digits[:, 0] * 10 + digits[:, 1]
+    month = digits[:, 2] * 10 + digits[:, 3]
+    year = ((digits[:, 4] * 10 + digits[:, 5]) * 10 + digits[:, 6]) * 10 + digits[:, 7]
+    ok &= (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31)
+    ts = days_from_civil(year, month, day).astype(np.float64) * SECONDS_PER_DAY \
+        + ((digits[:, 8] * 10 + digits[:, 9]) * 60 + digits[:, 10] * 10 + digits[:, 11]) * 60 \
+        + (digits[:, 12] * 10 + digits[:, 13])
+
+    # Pressure fields are gathered into character matrix and converted all at once
+    widths = sc1 - starts
+    ok &= widths <= MAX_PRESSURE_FIELD_WIDTH
+    rows = np.flatnonzero(ok)
+    width = widths[rows].max() if len(rows) else 0
+    columns = np.arange(width + 1)  # Extra column is always a separator
+    text = buf[np.clip(starts[rows, None] + columns, 0, len(buf) - 1)]
+    in_field = columns < widths[rows, None]
+    # Exactly one number per row: fields with spaces (e.g. blank) or without digits are left to parse_pressure_line
+    valid = np.all(_PRESSURE_CHARS[text] | ~in_field, axis=1) \
+        & np.any(in_field & (text >= ord('0')) & (text <= ord('9')), axis=1)
+    text[~in_field] = ord(' ')
+    if not valid.all():
+        ok[rows[~valid]] = False
+        rows = rows[valid]
+        text = text[valid]
+    text[text == ord(',')] = ord('.')
+    ps = np.zeros(len(ends))
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)  # Older numpy only warns about unparsable text
+            values = np.fromstring(text.tobytes(), dtype=np.float64, sep=' ')
+    except ValueError:
+        values = None
+    if values is not None and len(values) == np.count_nonzero(ok):
+        ps[ok] = values
+    else:  # Some field is not a number after all, parse the whole chunk line by line
+        ok[:] = False
+
+    n_skipped = 0
+    for i in np.flatnonzero(~ok & ~blank):
+        line = chunk[starts[i]:ends[i]].decode("iso-8859-1")
+        row = parse_pressure_line(line)
+        if row is not None:
+            ts[i], ps[i] = row
+            ok[i] = True
+        elif line.strip():
+            n_skipped += 1
+    return ts[ok], ps[ok], n_skipped
+
+
+def parse_pressure_csv(filename):
+    n_skipped = 0
+    ts, ps = [], []
+    try:
+        with open(filename, "rb") as file:
+            for _ in range(PRESSURE_HEADER_LINES):
+                file.readline()
+            while True:
+                chunk = file.read(PRESSURE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                chunk += file.readline()  # Complete the last line of the chunk
+                with profiling.stage("parse.pressure_chunk") as timing:
+                    chunk_ts, chunk_ps, chunk_skipped = parse_pressure_chunk(chunk)
+                    timing.add_points(len(chunk_ts))
+                ts.append(chunk_ts)
+                ps.append(chunk_ps)
+                n_skipped += chunk_skipped
+    except OSError:
+        print("Error while opening file '", filename, "':", sys.exc_info()[0])
+        return FileRecord.failed(), "Error for '" + filename + "'"
+
+    if not ts or not sum(len(t) for t in ts):
+        print("Error while opening file '", filename, "'")
+        return FileRecord.failed(), "Error for '" + filename + "'"
+    result = FileRecord("Ok", np.concatenate(ts), to_columns([np.concatenate(ps)]))  # Always 1 sensor in this file type
+    message = "Loaded '" + filename + "'"
+    if n_skipped:
+        message += ", skipped " + str(n_skipped) + " malformed rows"
+        print("File '", filename, "':", n_skipped, "malformed rows were skipped")
+    return result, message
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Headless batch conversion of Lakeshore (.xls) and pressure (.csv) files to .npz
+without starting the GUI. Files are parsed and calibrated in parallel worker processes.
+
+    python lakeshore_convert.py -l "logs/*.xls" -p "logs/*.csv" -c calibration.json -o out
+
+Each input file is written to <outdir>/<name>.npz (see output_filenames() for inputs
+with the same name) with arrays t, T1, ..., T4
+(temperature, or R1... with --resistance, or raw values X1... without calibration file,
+NaN for missing readings) for Lakeshore files and t, p for pressure files.
+
+With --merge all channels of all files are resampled onto one timebase and
+written as a single table (.csv or .npy) instead:
+
+    python lakeshore_convert.py -l "logs/*.xls" -p "logs/*.csv" -c calibration.json --merge merged.csv --dt 10
+
+Parsed files go through file_cache and are memory-mapped, so the merge runs in bounded memory.
+"""
+
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import file_cache
+import timebase
+from calibration import ChannelCalibration, load_calibration
+from export import write_table
+from file_parsers import parse_lakeshore_xls, parse_pressure_csv, N_SENSORS, \
+    LAKESHORE_PARSER_VERSION, PRESSURE_PARSER_VERSION
+
+
+def output_filenames(outdir, filenames):
+    """
+    {input file: output .npz file}. Output is <outdir>/<name>.npz, inputs with the same name
+    keep their directory relative to the common directory of these inputs and their extension:
+    d1/run.xls, d2/run.csv -> <outdir>/d1/run_xls.npz, <outdir>/d2/run_csv.npz.
+    Raises ValueError if a file is given twice or outputs still coincide.
+    """
+    by_stem = {}
+    for fn in filenames:
+        same = by_stem.setdefault(os.path.normcase(os.path.splitext(os.path.basename(fn))[0]), [])
+        if fn in same:
+            raise ValueError("'" + fn + "' is given twice")
+        same.append(fn)
+    outputs = {}
+    for same in by_stem.values():
+        if len(same) == 1:
+            outputs[same[0]] = os.path.join(outdir, os.path.splitext(os.path.basename(same[0]))[0] + ".npz")
+            continue
+        root = os.path.commonpath([os.path.dirname(os.path.abspath(fn)) for fn in same])
+        for fn in same:
+            stem, ext = os.path.splitext(os.path.relpath(os.path.abspath(fn), root))
+            outputs[fn] = os.path.join(outdir, stem + "_" + ext.lstrip(".") + ".npz")
+    seen = {}
+    for fn, out in outputs.items():
+        other = seen.setdefault(os.path.normcase(os.path.normpath(out)), fn)
+        if other is not fn:
+            raise ValueError("'" + fn + "' and '" + other + "' would be written to the same '" + out + "'")
+    return outputs
+
+
+def convert_lakeshore(filename, output, calibration, toT):
+    """Worker: calibration is a list of ChannelCalibration.toDict() or None. Returns (message, number of samples)"""
+    result, message = parse_lakeshore_xls(filename)
+    if not result.ok:
+        return message, 0
+    arrays = {"t": result.ts}
+    for s, ys in enumerate(result.columns):
+        name = str(s + 1)
+        if calibration is None:
+            arrays["X" + name] = ys
+        else:
+            ys = ChannelCalibration.fromDict(calibration[s]).evaluateArray(toT, ys)
+            arrays[("T" if toT else "R") + name] = ys
+    np.savez(output, **arrays)
+    return message, len(result.ts)
+
+
+def convert_pressure(filename, output):
+    result, message = parse_pressure_csv(filename)
+    if not result.ok:
+        return message, 0
+    np.savez(output, t=result.ts, p=result.columns[0])
+    return message, len(result.ts)
+
+
+def parse_to_cache(parser, parser_version, filename):
+    """Worker of the merge mode: result stays in file_cache. Returns (message, number of samples)"""
+    result, message = file_cache.cached_parse(parser, parser_version, filename)
+    return message, len(result.ts)
+
+
+def load_parsed(parser, parser_version, filename):
+    """Memory-mapped result from file_cache, parsing in this process if the cache is not available"""
+    result = file_cache.load(filename, parser_version)
+    if result is None:
+        result, message = parser(filename)
+    return result
+
+
+def merge_files(args, calibration, lakeshore_files, pressure_files, tmp_dir):
+    """Returns number of written rows"""
+    channels = []
+    records = [load_parsed(parse_lakeshore_xls, LAKESHORE_PARSER_VERSION, f) for f in lakeshore_files]
+    records = [r for r in records if r.ok]
+    for s in range(N_SENSORS if records else 0):
+        name = str(s + 1)
+        ts, ys = timebase.join_segments([r.channel(s) for r in records], tmp_dir, "X" + name)
+        if calibration is None:
+            channels.append(timebase.Channel("X" + name, ts, ys))
+        else:
+            convert = partial(ChannelCalibration.fromDict(calibration[s]).evaluateArray, not args.resistance)
+            channels.append(timebase.Channel(("R" if args.resistance else "T") + name, ts, ys, convert))
+    records = [load_parsed(parse_pressure_csv, PRESSURE_PARSER_VERSION, f) for f in pressure_files]
+    records = [r for r in records if r.ok]
+    if records:
+        ts, ps = timebase.join_segments([r.channel(0) for r in records], tmp_dir, "p")
+        channels.append(timebase.Channel("p", ts, ps))
+
+    bounds = timebase.time_range(channels)
+    if bounds is None:
+        return 0
+    t0, t1 = bounds
+    chunks = timebase.merge(channels, t0, t1, args.dt, args.method, args.max_gap)
+    return write_table(args.merge, [c.name for c in channels], chunks, timebase.merged_length(t0, t1, args.dt))
+
+
+def expand(patterns):
+    filenames = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            print("No files match '", pattern, "'")
+        filenames += [fn for fn in matches if fn not in filenames]
+    return filenames
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert Lakeshore and pressure logs to .npz files")
+    parser.add_argument("-l", "--lakeshore", nargs="*", default=[], help="Lakeshore .xls files or glob patterns")
+    parser.add_argument("-p", "--pressure", nargs="*", default=[], help="pressure .csv files or glob patterns")
+    parser.add_argument("-c", "--calibration", help="calibration .json saved from the calibration dialog")
+    parser.add_argument("-r", "--resistance", action="store_true", help="write calibrated resistance instead of temperature")
+    parser.add_argument("-o", "--outdir", default=".", help="output directory")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="number of worker processes")
+    parser.add_argument("-m", "--merge", help="write all channels resampled onto one timebase to this .csv or .npy file")
+    parser.add_argument("--dt", type=float, default=1.0, help="time step of the merged table in seconds")
+    parser.add_argument("--method", choices=timebase.METHODS, default="linear",
+                        help="interpolation or averaging of the samples within each step")
+    parser.add_argument("--max-gap", type=float, default=None,
+                        help="do not interpolate over gaps longer than this (seconds)")
+    args = parser.parse_args(argv)
+    if args.dt <= 0:
+        parser.error("--dt must be positive")
+
+    calibration = None
+    if args.calibration:
+        try:
+            calibration = [c.toDict() for c in load_calibration(args.calibration)]
+        except (OSError, ValueError) as err:
+            print("Error while loading calibration:", err)
+            return 1
+        if len(calibration) != N_SENSORS:
+            print("Calibration file must contain", N_SENSORS, "channels")
+            return 1
+    lakeshore_files = expand(args.lakeshore)
+    pressure_files = expand(args.pressure)
+    if not lakeshore_files and not pressure_files:
+        parser.print_usage()
+        return 1
+    if not args.merge:
+        try:
+            outputs = output_filenames(args.outdir, lakeshore_files + pressure_files)
+        except ValueError as err:
+            print("Error:", err)
+            return 1
+        for directory in set(os.path.dirname(out) for out in outputs.values()):
+            os.makedirs(directory or ".", exist_ok=True)
+
+    start = time.perf_counter()
+    n_failed = 0
+    n_samples = 0
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        if args.merge:
+            futures = [pool.submit(parse_to_cache, parse_lakeshore_xls, LAKESHORE_PARSER_VERSION, f)
+                       for f in lakeshore_files]
+            futures += [pool.submit(parse_to_cache, parse_pressure_csv, PRESSURE_PARSER_VERSION, f)
+                        for f in pressure_files]
+        else:
+            futures = [pool.submit(convert_lakeshore, f, outputs[f], calibration, not args.resistance)
+                       for f in lakeshore_files]
+            futures += [pool.submit(convert_pressure, f, outputs[f]) for f in pressure_files]
+        for future in as_completed(futures):
+            try:
+                message, n = future.result()
+            except OSError as err:  # Output can't be written
+                message, n = "Error: " + str(err), 0
+            print(message)
+            n_failed += n == 0
+            n_samples += n
+    if args.merge:
+        try:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                n_rows = merge_files(args, calibration, lakeshore_files, pressure_files, tmp_dir)
+        except (OSError, ValueError) as err:
+            print("Error while writing '", args.merge, "':", err)
+            return 1
+        print("Merged table of", n_rows, "rows is written to '" + args.merge + "'")
+    elapsed = time.perf_counter() - start
+    n_files = len(lakeshore_files) + len(pressure_files)
+    print("Converted {} of {} files, {} samples in {:.2f} s ({:.0f} samples/s)".format(
+        n_files - n_failed, n_files, n_samples, elapsed, n_samples / elapsed if elapsed else 0.0))
+    return 1 if n_failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,218 @@
+"""
+Following of growing log files. Tails start from the record loaded before, only the data
+appended since then is parsed and it is stored in ring buffers which hold the loaded
+samples plus TAIL_CAPACITY new ones, so that monitoring of a long run works in bounded
+memory. Qt-independent.
+"""
+
+import os
+import numpy as np
+from channel_store import FileRecord, VALUE_DTYPE
+from file_parsers import parse_pressure_chunk, parse_pressure_line, lakeshore_start_time, lakeshore_rows, \
+    N_SENSORS, PRESSURE_HEADER_LINES, PRESSURE_CHUNK_SIZE, LAKESHORE_FIRST_DATA_ROW
+
+TAIL_CAPACITY = 1024 * 1024  # samples per channel appended while following
+SEED_BLOCK_SIZE = 1 << 16  # Bytes read from the end of the file to find where the loaded data ends
+
+
+class RingBuffer:
+    """
+    Fixed capacity buffer keeping the last appended values. Every value is stored
+    twice, so that the contents are always available as a contiguous view (no copy).
+    The oldest values of a view are overwritten once the buffer wraps around.
+    """
+    def __init__(self, capacity=TAIL_CAPACITY, dtype=np.float64):
+        self.capacity = capacity
+        self._data = np.zeros(2 * capacity, dtype=dtype)
+        self._end = 0  # Next write position in [0, capacity)
+        self._size = 0
+        self.n_dropped = 0  # Overwritten values
+
+    def __len__(self):
+        return self._size
+
+    def append(self, values):
+        self.n_dropped += max(self._size + len(values) - self.capacity, 0)
+        values = np.asarray(values)[-self.capacity:]
+        idx = (self._end + np.arange(len(values))) % self.capacity
+        self._data[idx] = values
+        self._data[idx + self.capacity] = values
+        self._end = (self._end + len(values)) % self.capacity
+        self._size = min(self._size + len(values), self.capacity)
+
+    def view(self):
+        start = (self._end - self._size) % self.capacity
+        return self._data[start:start + self._size]
+
+
+def pressure_offset(filename, ts):
+    """
+    Byte position after the line of the last of ts, the sorted times of the pressure file
+    loaded before. The file is read backwards from the end only up to the earlier samples.
+    Returns None if the file does not contain the samples any more.
+    """
+    t_last = ts[-1]
+    n_last = len(ts) - int(np.searchsorted(ts, t_last, side="left"))  # Loaded samples at the last time
+    with open(filename, "rb") as file:
+        size = file.seek(0, os.SEEK_END)
+        block = SEED_BLOCK_SIZE
+        while True:
+            start = max(size - block, 0)
+            file.seek(start)
+            data = file.read(size - start)
+            if start:  # First line is incomplete
+                skip = data.find(b"\n") + 1
+                start += skip
+                data = data[skip:]
+            if not start:
+                break
+            first = parse_pressure_chunk(data)[0][:1] if data else []
+            if len(first) and first[0] < t_last:  # The block starts before the last loaded sample
+                break
+            block *= 2
+    # Lines are sorted in time, samples at the last time follow the earlier ones
+    pos = start
+    for line in data.splitlines(keepends=True):
+        pos += len(line)
+        sample = parse_pressure_line(line.decode("iso-8859-1"))
+        if sample is not None and sample[0] >= t_last:
+            if sample[0] > t_last:
+                break
+            n_last -= 1
+            if not n_last:
+                return pos
+    return None
+
+
+class PressureTail:
+    """Parses lines appended to the pressure .csv since the last poll, starting after the loaded record"""
+    def __init__(self, filename, record=None, capacity=TAIL_CAPACITY):
+        self.filename = filename
+        self.capacity = capacity
+        self.reset()
+        offset = pressure_offset(filename, record.ts) if record is not None and len(record.ts) else None
+        if offset is not None:
+            self.offset = offset
+            self.header_lines = 0
+            self.ts = RingBuffer(len(record.ts) + capacity)
+            self.ps = RingBuffer(len(record.ts) + capacity, VALUE_DTYPE)
+            self.ts.append(record.ts)
+            self.ps.append(record.columns[0])
+
+    def reset(self):
+        self.offset = 0  # Byte position after the last parsed complete line
+        self.header_lines = PRESSURE_HEADER_LINES
+        self.ts = RingBuffer(self.capacity)
+        self.ps = RingBuffer(self.capacity, VALUE_DTYPE)
+        self.n_skipped = 0
+
+    @property
+    def n_dropped(self):
+        return self.ts.n_dropped
+
+    def poll(self):
+        """Returns number of new samples"""
+        size = os.path.getsize(self.filename)
+        if size < self.offset:  # File was truncated or replaced
+            self.reset()
+        n_new = 0
+        with open(self.filename, "rb") as file:
+            file.seek(self.offset)
+            while self.offset < size:
+                chunk = file.read(min(size - self.offset, PRESSURE_CHUNK_SIZE))
+                end = chunk.rfind(b"\n") + 1  # Incomplete last line is left for the next poll
+                if not end:
+                    break
+                file.seek(self.offset + end)
+                self.offset += end
+                n_new += self._parse(chunk[:end])
+        return n_new
+
+    def _parse(self, chunk):
+        while self.header_lines and chunk:
+            chunk = chunk[chunk.find(b"\n") + 1:]
+            self.header_lines -= 1
+        if not chunk:
+            return 0
+        ts, ps, n_skipped = parse_pressure_chunk(chunk)
+        self.ts.append(ts)
+        self.ps.append(ps)
+        self.n_skipped += n_skipped
+        return len(ts)
+
+    def result(self):
+        """Current data in the format of file_parsers"""
+        return FileRecord("Ok", self.ts.view(), [self.ps.view()])
+
+
+def read_lakeshore_rows(filename, first_row):
+    """
+    Worker: reads the .xls file again, it can't be read partially.
+    Returns (first_row, number of rows, ts, columns) of the rows from first_row, ts is None if there are none.
+    """
+    import xlrd  # Not needed at startup
+    book = xlrd.open_workbook(filename, on_demand=True)
+    try:
+        sh = book.sheet_by_index(0)
+        if sh.nrows <= first_row:
+            return first_row, sh.nrows, None, None
+        ts, columns = lakeshore_rows(sh, lakeshore_start_time(sh), first_row)
+        return first_row, sh.nrows, ts, columns
+    finally:
+        book.release_resources()
+
+
+class LakeshoreTail:
+    """
+    .xls file is read again by read_lakeshore_rows() when its size or modification time
+    changes (changed()), but only the rows added since the last read are converted and
+    appended (append_rows()). poll() does both in the calling thread.
+    """
+    def __init__(self, filename, record=None, capacity=TAIL_CAPACITY):
+        self.filename = filename
+        self.capacity = capacity
+        self.stat = None
+        n_loaded = len(record.ts) if record is not None else 0
+        # Rows with invalid time are not loaded, so some loaded rows may be read again
+        self.next_row = LAKESHORE_FIRST_DATA_ROW + n_loaded
+        self.ts = RingBuffer(n_loaded + capacity)
+        self.ys = [RingBuffer(n_loaded + capacity, VALUE_DTYPE) for s in range(N_SENSORS)]
+        if n_loaded:
+            self.ts.append(record.ts)
+            for s in range(N_SENSORS):
+                self.ys[s].append(record.columns[s])
+
+    @property
+    def n_dropped(self):
+        return self.ts.n_dropped
+
+    def changed(self):
+        """True if the file has to be read again"""
+        st = os.stat(self.filename)
+        stat = (st.st_size, st.st_mtime_ns)
+        if stat == self.stat:
+            return False
+        self.stat = stat
+        return True
+
+    def append_rows(self, first_row, n_rows, ts, columns):
+        """Appends result of read_lakeshore_rows(), returns number of new rows"""
+        if first_row != self.next_row or ts is None:  # Outdated read
+            return 0
+        self.next_row = n_rows
+        if len(self.ts):
+            new = ts > self.ts.view()[-1]
+            ts, columns = ts[new], [ys[new] for ys in columns]
+        self.ts.append(ts)
+        for s in range(N_SENSORS):
+            self.ys[s].append(columns[s])
+        return len(ts)
+
+    def poll(self):
+        """Returns number of new rows"""
+        if not self.changed():
+            return 0
+        return self.append_rows(*read_lakeshore_rows(self.filename, self.next_row))
+
+    def result(self):
+        return FileRecord("Ok", self.ts.view(), [ys.view() for ys in self.ys])
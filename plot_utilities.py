@@ -1,24 +1,23 @@
+from functools import lru_cache
 from pyqtgraph import AxisItem
 import numpy as np
+import profiling
+from time_utilities import timestr_to_seconds, second_to_timestr, seconds_to_timestrs
 
-def timestr_to_seconds(string):
-    try:
-        start_time = string.split(":")
-        start_time = (int(start_time[0]) * 60 + int(start_time[1])) * 60 + float(start_time[2])
-    except (ValueError, IndexError) as err:
-        print("Error while converting string \"" + string + "\"to seconds")
-        print(err)
-        print(err.args)
-        return None
-    return start_time
-
-def second_to_timestr(seconds, fmt):
-    H = int(np.floor(seconds) // 3600)
-    MM = np.floor(seconds) % 3600
-    M = int(MM // 60)
-    S = int(MM % 60)
-    s = S + seconds - np.floor(seconds)
-    return fmt.format(H=H, M=M, S=S, s=s)
+TICK_CACHE_SIZE = 128  # Axis repaints at recently used zoom levels don't recompute ticks and labels
+
+
+@lru_cache(maxsize=TICK_CACHE_SIZE)
+def _major_ticks(dt, offset, first, n_ticks, max_steps):
+    ticks = offset + dt * np.arange(first, first + n_ticks, dtype=np.float64)
+    if n_ticks > max_steps:
+        ticks = ticks[::int(np.ceil(float(n_ticks) / max_steps))]
+    return tuple(ticks.tolist())
+
+
+@lru_cache(maxsize=TICK_CACHE_SIZE)
+def _tick_strings(values, fmt):
+    return tuple(seconds_to_timestrs(values, fmt))
 
 
 class DateAxisItem(AxisItem):
@@ -32,6 +31,15 @@ class DateAxisItem(AxisItem):
     """
     # Max width in pixels reserved for each label in axis
     _pxLabelWidth = 80
+    # (range, major tick spacing) in seconds: spacing is used when visible range is above range
+    _majorSpacings = [(2419200, 604800),  # 4 weeks: 1 week
+                      (691200, 172800),  # 8 days: 2 days
+                      (172800, 86400),  # 2 days: 1 day, at midnight
+                      (43200, 10800),  # 12 hours: 3 hours
+                      (7200, 1800),  # 3600s*2 = 2hours: 30 minutes
+                      (1200, 300),  # 60s*20 = 20 minutes: 5 minutes
+                      (120, 30),  # 60s*2 = 2 minutes: 30 seconds
+                      (20, 5)]  # 20s: 5 seconds
 
     def __init__(self, *args, **kwargs):
         AxisItem.__init__(self, *args, **kwargs)
@@ -44,54 +52,38 @@ class DateAxisItem(AxisItem):
         rounding in a decimal base
         """
 
-        maxMajSteps = int(size / self._pxLabelWidth)
+        with profiling.stage("axis.tickValues"):
+            return self._tickValues(minVal, maxVal, size)
+
+    def _tickValues(self, minVal, maxVal, size):
+        maxMajSteps = max(int(size / self._pxLabelWidth), 1)
 
         dx = maxVal - minVal
-        majticks = []
-        #TODO optimize
-        if dx > 7200:  # 3600s*2 = 2hours
-            dt = 1800
-            tick = dt * (np.floor(minVal) // dt) + dt
-            while tick < maxVal:
-                majticks.append(tick)
-                tick += dt
-
-        elif dx > 1200:  # 60s*20 = 20 minutes
-            dt = 300  # 5 minutes
-            tick = dt * (np.floor(minVal) // dt) + dt
-            while tick < maxVal:
-                majticks.append(tick)
-                tick += dt
-
-        elif dx > 120:  # 60s*2 = 2 minutes
-            dt = 30  # 30 seconds
-            tick = dt * (np.floor(minVal) // dt) + dt
-            while tick < maxVal:
-                majticks.append(tick)
-                tick += dt
-
-        elif dx > 20:  # 20s
-            dt = 5  # 5 seconds
-            tick = dt * (np.floor(minVal) // dt) + dt
-            while tick < maxVal:
-                majticks.append(tick)
-                tick += dt
+        for min_range, dt in self._majorSpacings:
+            if dx > min_range:
+                break
         else:  # <20s , use standard implementation from parent
             return AxisItem.tickValues(self, minVal, maxVal, size)
 
-        L = len(majticks)
-        if L > maxMajSteps:
-            majticks = majticks[::int(np.ceil(float(L) / maxMajSteps))]
-
-        return [(dt, majticks)]
+        # Weeks start on Monday, 1970-01-01 was Thursday
+        offset = 4 * 86400 if dt == 604800 else 0
+        # Ticks are fully defined by the first tick index and their number, which are used as a cache key
+        first = np.floor(minVal - offset) // dt + 1
+        n_ticks = max(int(np.ceil((maxVal - offset - dt * first) / dt)), 0)
+        return [(dt, list(_major_ticks(dt, offset, int(first), n_ticks, maxMajSteps)))]
 
     def tickStrings(self, values, scale, spacing):
         """Reimplemented from PlotItem to adjust to the range"""
-        ret = []
-        if not values:
+        if not len(values):
             return []
 
-        if spacing >= 60:  # 1 m
+        if spacing >= 86400:  # 1 day
+            fmt = "{date}"
+
+        elif spacing >= 10800:  # 3 h, a span of several days
+            fmt = "{day} {H:02d}:{M:02d}"
+
+        elif spacing >= 60:  # 1 m
             fmt = "{H:02d}:{M:02d}"
 
         elif spacing >= 1:  # 1s
@@ -101,13 +93,8 @@ class DateAxisItem(AxisItem):
             # less than 2s (show microseconds)
             fmt = "{M:02d}:{s:06.3f}"
 
-        for x in values:
-            try:
-                ret.append(second_to_timestr(x, fmt))
-            except ValueError:  # Windows can't handle dates before 1970
-                ret.append('')
-
-        return ret
+        with profiling.stage("axis.tickStrings", len(values)):
+            return list(_tick_strings(tuple(values), fmt))
 
     def attachToPlotItem(self, plotItem):
         """Add this axis to the given PlotItem
@@ -127,4 +114,66 @@ class DateAxisItem(AxisItem):
         """Remove this axis from its attached PlotItem
         (not yet implemented)
         """
-        raise NotImplementedError()  # TODO
\ No newline at end of file
+        raise NotImplementedError()  # TODO
+
+class CurvesModel:
+    """
+    Keeps one persistent curve item per key (e.g. (file, channel)) on the plot.
+    Items are added, updated or removed only when their data change instead of
+    clearing and replotting everything. Curves are drawn from MinMaxPyramid and
+    are decimated to the current view range and width.
+    """
+    def __init__(self, plot):
+        self.plot = plot
+        self.curves = {}  # {key: (data key, MinMaxPyramid, PlotDataItem)}
+        view_box = plot.getViewBox()
+        view_box.sigXRangeChanged.connect(self.update_lod)
+        view_box.sigResized.connect(self.update_lod)
+
+    def view(self):
+        view_box = self.plot.getViewBox()
+        t0, t1 = view_box.viewRange()[0]
+        return t0, t1, view_box.width()
+
+    def set_curves(self, curves):
+        """
+        curves is {key: (data key, make_pyramid, pen)}. make_pyramid() is called only for
+        new curves and for curves whose data key changed. Returns number of such curves.
+        """
+        for key in [k for k in self.curves if k not in curves]:
+            self.plot.removeItem(self.curves.pop(key)[2])
+        t0, t1, width = self.view()
+        n_changed = 0
+        with profiling.stage("plot.set_curves") as timing:
+            for key, (data_key, make_pyramid, pen) in curves.items():
+                old = self.curves.get(key)
+                if old is not None and old[0] == data_key:
+                    continue
+                pyramid = make_pyramid()
+                ts, ys = pyramid.query(t0, t1, width)
+                if old is None:
+                    item = self.plot.plot(ts, ys, pen=pen)
+                else:
+                    item = old[2]
+                    item.setData(ts, ys)
+                self.curves[key] = (data_key, pyramid, item)
+                n_changed += 1
+                timing.add_points(len(ts))
+        return n_changed
+
+    def nearest(self, t):
+        """[(key, sample index, time, value)] of the samples nearest to t of the visible curves, as plotted"""
+        found = []
+        for key, (data_key, pyramid, item) in sorted(self.curves.items()):
+            i = pyramid.nearest(t) if item.isVisible() else None
+            if i is not None:
+                found.append((key, i, pyramid.ts[i], pyramid.ys[i]))
+        return found
+
+    def update_lod(self):
+        t0, t1, width = self.view()
+        with profiling.stage("plot.update_lod") as timing:
+            for data_key, pyramid, item in self.curves.values():
+                ts, ys = pyramid.query(t0, t1, width)
+                item.setData(ts, ys)
+                timing.add_points(len(ts))
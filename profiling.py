@@ -0,0 +1,135 @@
+"""
+Lightweight timing of the hot paths (parsing, calibration, plotting, axis ticks, mouse moves).
+Disabled by default, then stage() returns a shared no-op context and costs about
+one function call. Enabled with enable(True) or LAKESHORE_VIEWER_PROFILE=1 environment
+variable. Qt-independent.
+
+    with profiling.stage("calibration", len(values)):
+        ...
+"""
+
+import os
+import threading
+import time
+
+_enabled = os.environ.get("LAKESHORE_VIEWER_PROFILE", "") not in ("", "0")
+_lock = threading.Lock()
+_stats = {}  # {stage name: StageStats}
+
+
+class StageStats:
+    __slots__ = ("calls", "total", "max", "last", "points")
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0  # s
+        self.max = 0.0
+        self.last = 0.0
+        self.points = 0
+
+    def add(self, elapsed, points):
+        self.calls += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.last = elapsed
+        self.points += points
+
+    def to_tuple(self):
+        return self.calls, self.total, self.max, self.last, self.points
+
+
+class _NoStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add_points(self, points):
+        pass
+
+
+_NO_STAGE = _NoStage()
+
+
+class _Stage:
+    __slots__ = ("name", "points", "start")
+
+    def __init__(self, name, points):
+        self.name = name
+        self.points = points
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.start, self.points)
+        return False
+
+    def add_points(self, points):
+        self.points += points
+
+
+def enabled():
+    return _enabled
+
+
+def enable(flag=True):
+    global _enabled
+    _enabled = bool(flag)
+
+
+def stage(name, points=0):
+    """Context manager timing the block, points is e.g. number of processed samples"""
+    if not _enabled:
+        return _NO_STAGE
+    return _Stage(name, points)
+
+
+def record(name, elapsed, points=0):
+    with _lock:
+        stats = _stats.get(name)
+        if stats is None:
+            stats = _stats[name] = StageStats()
+        stats.add(elapsed, points)
+
+
+def snapshot():
+    """{stage name: (calls, total s, max s, last s, points)}"""
+    with _lock:
+        return {name: stats.to_tuple() for name, stats in _stats.items()}
+
+
+def merge(stats):
+    """Adds snapshot() of another process"""
+    with _lock:
+        for name, (calls, total, maximum, last, points) in stats.items():
+            own = _stats.setdefault(name, StageStats())
+            own.calls += calls
+            own.total += total
+            own.max = max(own.max, maximum)
+            own.last = last
+            own.points += points
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+def call_profiled(func, *args):
+    """Runs func(*args) in a worker process with timing enabled. Returns (func result, snapshot())"""
+    enable(True)
+    reset()
+    return func(*args), snapshot()
+
+
+def format_table(stats):
+    """Text table of snapshot() sorted by total time"""
+    lines = ["{:28s} {:>7s} {:>10s} {:>10s} {:>10s} {:>12s}".format(
+        "stage", "calls", "total, ms", "mean, ms", "max, ms", "points")]
+    for name, (calls, total, maximum, last, points) in sorted(stats.items(), key=lambda item: -item[1][1]):
+        lines.append("{:28s} {:7d} {:10.1f} {:10.3f} {:10.3f} {:12d}".format(
+            name, calls, 1000 * total, 1000 * total / calls if calls else 0.0, 1000 * maximum, points))
+    return "\n".join(lines)
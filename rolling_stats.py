@@ -0,0 +1,139 @@
+"""
+Streaming statistics over the last `window` seconds of a sorted series: mean,
+standard deviation, minimum, maximum and rate of change (least squares slope).
+Qt-independent.
+update() gets the whole series each time (e.g. the plotted arrays, which are rebuilt
+when followed files grow) and processes only the samples appended since the previous
+call: sums are updated by adding new and subtracting evicted samples, minimum and
+maximum are kept in monotonic queues, so that every sample costs O(1) amortized.
+A large number of new samples (e.g. a static load) is handled by a vectorized
+pass over the last window only, the earlier history is never scanned.
+"""
+
+from collections import deque, namedtuple
+import numpy as np
+
+DEFAULT_WINDOW = 600.0  # s
+BULK_SIZE = 256  # new samples, more of them are processed by numpy instead of a python loop
+STABLE_DRIFT = 2.0  # drift over the window in standard deviations, below it the series is stable
+
+WindowStats = namedtuple("WindowStats", ["n", "mean", "std", "min", "max", "rate"])  # rate is per second
+
+
+class RollingStats:
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = float(window)
+        self.reset()
+
+    def reset(self):
+        self.n_seen = 0  # Samples of the series processed so far
+        self._last = None  # (t, y) of the last processed sample, to detect that the series was replaced
+        self._start = 0  # Index of the first sample in the window
+        self._t_ref = 0.0  # Sums are of t - t_ref and y - y_ref to keep precision
+        self._y_ref = 0.0
+        self._sums = [0, 0.0, 0.0, 0.0, 0.0, 0.0]  # n, y, y^2, t, t^2, t*y of the finite samples in the window
+        self._mins = deque()  # Indices with increasing values
+        self._maxs = deque()  # Indices with decreasing values
+        self._n_evicted = 0  # Since the last exact recomputation of the sums
+
+    def update(self, ts, ys):
+        """ts, ys are the whole sorted series, which is either the one seen before with appended samples or a new one"""
+        n = len(ts)
+        if self.n_seen and (n < self.n_seen or not self._is_last(ts[self.n_seen - 1], ys[self.n_seen - 1])):
+            self.reset()
+        if n == self.n_seen:
+            return
+        if n - self.n_seen > BULK_SIZE or self._n_evicted > max(BULK_SIZE, self._sums[0]):
+            self._rebuild(ts, ys)
+        else:
+            for i in range(self.n_seen, n):
+                self._push(ts, ys, i)
+        self.n_seen = n
+        self._last = (float(ts[-1]), float(ys[-1]))
+
+    def stats(self):
+        """WindowStats of the last window, None if it has no finite samples"""
+        n, sy, syy, st, stt, sty = self._sums
+        if not n:
+            return None
+        mean = sy / n
+        var = max(syy / n - mean * mean, 0.0)
+        t_var = stt / n - (st / n) ** 2
+        rate = (sty / n - st / n * mean) / t_var if n > 1 and t_var > 0 else 0.0
+        return WindowStats(n, self._y_ref + mean, np.sqrt(var), self._extreme(self._mins),
+                           self._extreme(self._maxs), rate)
+
+    def is_stable(self):
+        """True if the drift over the window is within the noise, None if unknown"""
+        s = self.stats()
+        if s is None or s.n < 3:
+            return None
+        return abs(s.rate) * self.window <= STABLE_DRIFT * s.std
+
+    def _is_last(self, t, y):
+        last_t, last_y = self._last
+        return t == last_t and (y == last_y or (y != y and last_y != last_y))
+
+    def _extreme(self, queue):
+        return float(self._ys[queue[0]]) if queue else np.nan
+
+    def _rebuild(self, ts, ys):
+        """Exact recomputation over the last window with numpy"""
+        ts = np.asarray(ts)
+        ys = np.asarray(ys)
+        self._ys = ys
+        start = int(np.searchsorted(ts, ts[-1] - self.window, side="left"))
+        t = ts[start:].astype(np.float64)
+        y = ys[start:].astype(np.float64)
+        finite = np.isfinite(y)
+        indices = np.flatnonzero(finite) + start
+        t, y = t[finite], y[finite]
+        self._start = start
+        self._n_evicted = 0
+        self._t_ref = float(t[0]) if len(t) else 0.0
+        self._y_ref = float(y[0]) if len(y) else 0.0
+        t -= self._t_ref
+        y -= self._y_ref
+        self._sums = [len(y), float(y.sum()), float((y * y).sum()), float(t.sum()), float((t * t).sum()),
+                      float((t * y).sum())]
+        # Monotonic queues are the samples which are smaller (larger) than all later ones
+        later_min = np.append(np.minimum.accumulate(y[::-1])[::-1][1:], np.inf)
+        later_max = np.append(np.maximum.accumulate(y[::-1])[::-1][1:], -np.inf)
+        self._mins = deque(indices[y < later_min].tolist())
+        self._maxs = deque(indices[y > later_max].tolist())
+
+    def _push(self, ts, ys, i):
+        self._ys = ys
+        t = float(ts[i])
+        y = float(ys[i])
+        if y == y:  # Not NaN
+            if not self._sums[0]:  # Also drops rounding errors left by the evicted samples
+                self._t_ref, self._y_ref = t, y
+                self._sums = [0, 0.0, 0.0, 0.0, 0.0, 0.0]
+            self._add(t, y, 1)
+            while self._mins and ys[self._mins[-1]] >= y:
+                self._mins.pop()
+            self._mins.append(i)
+            while self._maxs and ys[self._maxs[-1]] <= y:
+                self._maxs.pop()
+            self._maxs.append(i)
+        while ts[self._start] < t - self.window:
+            evicted = float(ys[self._start])
+            if evicted == evicted:
+                self._add(float(ts[self._start]), evicted, -1)
+                self._n_evicted += 1
+            self._start += 1
+        for queue in (self._mins, self._maxs):
+            while queue and queue[0] < self._start:
+                queue.popleft()
+
+    def _add(self, t, y, sign):
+        t -= self._t_ref
+        y -= self._y_ref
+        sums = self._sums
+        sums[0] += sign
+        sums[1] += sign * y
+        sums[2] += sign * y * y
+        sums[3] += sign * t
+        sums[4] += sign * t * t
+        sums[5] += sign * t * y
@@ -0,0 +1,176 @@
+"""
+Session: loaded files, their per-channel timelines with plotting pyramids and the
+calibration saved as a directory of .npy arrays plus manifest.json. Arrays are
+memory-mapped on opening, so that it is nearly instant and only the viewed parts
+are read from disk. Qt-independent.
+
+    <session>/manifest.json
+    <session>/g<group>/f<file>/t.npy, 0.npy, ...     FileRecord of every loaded file
+    <session>/g<group>/c<channel>/t.npy, y.npy, ...  merged timeline and pyramid levels
+    <session>/g0/c<channel>/R, T/y.npy, ...          calibrated pyramids of Lakeshore channels
+Calibrated pyramids are stored with ChannelCalibration.parametersHash() and are
+used after opening only while the calibration has the same hash.
+"""
+
+import json
+import os
+import shutil
+import numpy as np
+from calibration import ChannelCalibration
+from channel_store import ChannelStore, FileRecord, save_record, load_record, load_array
+from decimation import MinMaxPyramid
+from timeline import ChannelTimeline, TimelineIndex
+
+SESSION_FORMAT_VERSION = 1
+SESSION_EXTENSION = ".session"
+_MANIFEST = "manifest.json"
+
+
+def _save_levels(directory, pyramid):
+    for i, level in enumerate(pyramid.levels):
+        for name, array in zip(("t", "min", "max"), level):
+            np.save(os.path.join(directory, "L" + str(i) + "_" + name + ".npy"), np.asarray(array))
+    return len(pyramid.levels)
+
+
+def _load_levels(directory, n_levels):
+    return [tuple(load_array(os.path.join(directory, "L" + str(i) + "_" + name + ".npy"))
+                  for name in ("t", "min", "max")) for i in range(n_levels)]
+
+
+def _save_timeline(directory, timeline, files):
+    """Stores timeline arrays, or references to the file record if the timeline is a view of it"""
+    entry = {"filenames": timeline.filenames}
+    for f, (fn, record) in enumerate(files):
+        for c, ys in enumerate(record.columns):
+            if timeline.ts is record.ts and timeline.ys is ys:
+                entry["file"] = f
+                entry["column"] = c
+    if "file" not in entry:
+        np.save(os.path.join(directory, "t.npy"), np.asarray(timeline.ts))
+        np.save(os.path.join(directory, "y.npy"), np.asarray(timeline.ys))
+        if timeline.file_index is not None:
+            np.save(os.path.join(directory, "file_index.npy"), timeline.file_index)
+    entry["n_levels"] = _save_levels(directory, timeline.pyramid())
+    return entry
+
+
+def _load_timeline(directory, entry, records):
+    if "file" in entry:
+        ts, ys = records[entry["file"]].channel(entry["column"])
+        file_index = None
+    else:
+        ts = load_array(os.path.join(directory, "t.npy"))
+        ys = load_array(os.path.join(directory, "y.npy"))
+        path = os.path.join(directory, "file_index.npy")
+        file_index = load_array(path) if os.path.exists(path) else None
+    return ChannelTimeline.from_arrays(entry["filenames"], ts, ys, file_index,
+                                       MinMaxPyramid.from_levels(ts, ys, _load_levels(directory, entry["n_levels"])))
+
+
+def _save_calibrated(directory, pyramid):
+    os.makedirs(directory)
+    np.save(os.path.join(directory, "y.npy"), np.asarray(pyramid.ys))
+    return _save_levels(directory, pyramid)
+
+
+def _load_calibrated(directory, n_levels, ts):
+    ys = load_array(os.path.join(directory, "y.npy"))
+    return MinMaxPyramid.from_levels(ts, ys, _load_levels(directory, n_levels))
+
+
+def save_session(path, stores, indexes, calibration, calibrated=None):
+    """
+    stores are ChannelStore of every group of files, indexes are their up to date TimelineIndex,
+    calibration is [ChannelCalibration], calibrated is {(channel, toT): MinMaxPyramid} of the
+    first group calibrated with it. Existing session at path is replaced, it is kept
+    if the new one can't be put in its place (OSError is raised then).
+    """
+    if os.path.exists(path) and not os.path.exists(os.path.join(path, _MANIFEST)):
+        raise ValueError("'" + path + "' exists and is not a session")
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    groups = []
+    for g, (store, index) in enumerate(zip(stores, indexes)):
+        files = sorted(store.items(), key=lambda item: item[0])
+        group = {"files": [], "channels": []}
+        for f, (fn, record) in enumerate(files):
+            directory = os.path.join("g" + str(g), "f" + str(f))
+            os.makedirs(os.path.join(tmp_path, directory))
+            if record.ok:
+                save_record(os.path.join(tmp_path, directory), record)
+            group["files"].append({"filename": fn, "status": record.status, "n_columns": record.n_channels,
+                                   "dir": directory})
+        for c, timeline in enumerate(index.channels):
+            directory = os.path.join("g" + str(g), "c" + str(c))
+            os.makedirs(os.path.join(tmp_path, directory))
+            entry = _save_timeline(os.path.join(tmp_path, directory), timeline, files)
+            entry["dir"] = directory
+            entry["calibrated"] = []
+            for toT in (False, True):
+                pyramid = (calibrated or {}).get((c, toT)) if g == 0 else None
+                if pyramid is not None:
+                    sub_directory = os.path.join(directory, "T" if toT else "R")
+                    n_levels = _save_calibrated(os.path.join(tmp_path, sub_directory), pyramid)
+                    entry["calibrated"].append({"toT": toT, "hash": calibration[c].parametersHash(),
+                                                "dir": sub_directory, "n_levels": n_levels})
+            group["channels"].append(entry)
+        groups.append(group)
+    with open(os.path.join(tmp_path, _MANIFEST), "w") as file:
+        json.dump({"version": SESSION_FORMAT_VERSION, "groups": groups,
+                   "calibration": [c.toDict() for c in calibration]}, file, indent=1)
+    # The old session may be open (memory-mapped), so it is moved aside and removed only after
+    # the new one is in place. If it can't be moved (mapped files on Windows), it is kept as is.
+    old_path = path + ".old"
+    try:
+        if os.path.exists(path):
+            shutil.rmtree(old_path, ignore_errors=True)
+            os.replace(path, old_path)
+        try:
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(old_path):
+                os.replace(old_path, path)
+            raise
+    except OSError:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    shutil.rmtree(old_path, ignore_errors=True)  # Files still mapped on Windows are left until the next save
+
+
+def load_session(path):
+    """
+    Returns ([ChannelStore], [TimelineIndex], [ChannelCalibration], {(channel, toT): (hash, MinMaxPyramid)}).
+    Raises OSError or ValueError for bad session
+    """
+    with open(os.path.join(path, _MANIFEST), "r") as file:
+        manifest = json.load(file)
+    try:
+        if manifest["version"] > SESSION_FORMAT_VERSION:
+            raise ValueError("Session '" + path + "' is written by newer version")
+        stores, indexes, calibrated = [], [], {}
+        for group in manifest["groups"]:
+            store = ChannelStore()
+            records = []
+            for entry in group["files"]:
+                if entry["status"] == "Ok":
+                    record = load_record(os.path.join(path, entry["dir"]), entry["status"], entry["n_columns"])
+                else:
+                    record = FileRecord.failed()
+                store[entry["filename"]] = record
+                records.append(record)
+            index = TimelineIndex()
+            index.restore(store, [_load_timeline(os.path.join(path, entry["dir"]), entry, records)
+                                  for entry in group["channels"]])
+            if not stores:  # Calibrated pyramids are only in the first group
+                for c, (entry, timeline) in enumerate(zip(group["channels"], index.channels)):
+                    for cal in entry.get("calibrated", []):  # Sessions written before had none
+                        pyramid = _load_calibrated(os.path.join(path, cal["dir"]), cal["n_levels"], timeline.ts)
+                        calibrated[(c, cal["toT"])] = (cal["hash"], pyramid)
+            stores.append(store)
+            indexes.append(index)
+        calibration = [ChannelCalibration.fromDict(c) for c in manifest["calibration"]]
+    except (KeyError, TypeError, IndexError) as err:
+        raise ValueError("Invalid session '" + path + "': " + str(err))
+    return stores, indexes, calibration, calibrated
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Appends samples to a pressure .csv file the way the pressure logger does,
+to try 'Follow files' mode of the viewer without real equipment:
+    python simulate_logger.py pressure.csv --interval 0.5
+then load pressure.csv in the viewer and check 'Follow files'.
+"""
+
+import argparse
+import datetime
+import os
+import random
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("filename")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between samples")
+    parser.add_argument("--rows", type=int, default=0, help="stop after writing this many rows (0 = never)")
+    args = parser.parse_args()
+
+    new_file = not os.path.exists(args.filename)
+    with open(args.filename, "a", encoding="iso-8859-1") as file:
+        if new_file:
+            file.write("Pressure logger (simulated)\n")
+            file.write("Pressure [bar];Status;Time\n")
+        p = 1.0
+        n = 0
+        while not args.rows or n < args.rows:
+            p = max(p * (1.0 + random.gauss(0.0, 0.01)), 1e-6)
+            now = datetime.datetime.now().strftime("%d.%m.%Y %H:%M:%S")
+            file.write("{:.6E};0;{}\n".format(p, now).replace(".", ",", 1))
+            file.flush()
+            n += 1
+            time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
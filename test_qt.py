@@ -1,92 +1,84 @@
 #!/usr/bin/env python3
 
 import sys
-from PyQt5 import QtWidgets, QtCore, uic, QtGui
+from PyQt5 import QtWidgets, QtCore, QtGui
 from PyQt5.QtWidgets import *
 import pyqtgraph as pg
-from scipy.interpolate import interp1d
-import xlrd  # reading xls files
 import numpy as np
 import os
+import multiprocessing
+import time
+import threading
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from plot_utilities import *
+from ui_loader import load_ui
+from calibration import ChannelCalibration, CalibrationCache, save_calibration, load_calibration, \
+    save_last_profile, load_last_profile
+from calibration_curves import available_curves
+from decimation import MinMaxPyramid
+from live_tail import LakeshoreTail, PressureTail, read_lakeshore_rows
+from file_parsers import parse_lakeshore_xls, parse_pressure_csv, LAKESHORE_PARSER_VERSION, PRESSURE_PARSER_VERSION
+import file_cache
+import profiling
+from channel_store import ChannelStore, FileRecord
+import timebase
+from timeline import TimelineIndex
+from session import save_session, load_session, SESSION_EXTENSION
+from export import write_table, EXPORT_FORMATS, ExportCancelled
+from rolling_stats import RollingStats
 
 ## Switch to using white background and black foreground
 pg.setConfigOption('background', 'w')
 pg.setConfigOption('foreground', 'k')
 
+TAIL_POLL_INTERVAL = 500  # ms, how often followed files are checked for new data
+MIN_REFRESH_INTERVAL = 1000  # ms, plots are not updated more often than this in follow mode
+DEFAULT_MERGE_STEP = 1.0  # s
+EXPORT_MODES = ("Per channel", "Merged")
+DEFAULT_CURSOR_RATE = 60  # Hz, mouse moves are coalesced to the screen refresh rate or to this
+DIAGNOSTICS_REFRESH_INTERVAL = 1000  # ms
+BROWSE_CURVE = "Other file ..."  # Last item of the calibration curve lists
 
-class ChannelCalibration:
-    def __init__(self):
-        self.useOhms = True
-        self.R_offset = 0.0
-        self.R_scale = 1.0
-        # Reference points (can recalibrate using only single one)
-        self.X1 = None
-        self.X2 = None
-        self.T1 = None
-        self.T2 = None
-
-        curve_raw = np.loadtxt("Pt100_curve.dat", skiprows=1)
-        self.TR_curve = interp1d(curve_raw[:, 0], curve_raw[:, 1])
-        self.RT_curve = interp1d(curve_raw[:, 1], curve_raw[:, 0])
-
-    def getCurveR(self, T):
-        return self.TR_curve(T)
-
-    def getCurveT(self, R):
-        return self.RT_curve(R)
-
-    def evaluateR(self, file_value):
-        if self.useOhms:
-            return (file_value + self.R_offset) * self.R_scale
-        R = self.getCurveR(file_value)
-        return (R + self.R_offset) * self.R_scale
-
-    def evaluateT(self, file_value):
-        return self.getCurveT(self.evaluateR(file_value))
-
-    def __calibrateBy1Point(self, x, T):
-        self.R_scale = 1.0
-        if self.useOhms:
-            self.R_offset = self.getCurveR(T) - x
-        else:
-            self.R_offset = self.getCurveR(T) - self.getCurveR(x)
 
-    def calibrateByPoints(self):
-        if (self.X1 is None or self.T1 is None) and (self.X2 is None or self.T2 is None):
-            self.R_offset = 0.0
-            self.R_scale = 1.0
-            return
-        if not(self.X1 is None or self.T1 is None) and not(self.X2 is None or self.T2 is None):
-            if (self.X1 == self.X2) or (self.T1 == self.T2):
-                self.__calibrateBy1Point(self.X1, self.T1)
-                return
-            R1 = self.X1
-            R2 = self.X2
-            if not self.useOhms:
-                R1 = self.getCurveR(self.X1)
-                R2 = self.getCurveR(self.X2)
-            RT1 = self.getCurveR(self.T1)
-            RT2 = self.getCurveR(self.T2)
-            self.R_scale = (RT1 - RT2) / (R1 - R2)
-            self.R_offset = RT1 - self.R_scale * R1  # == RT2 - self.R_scale * R2
-            return
-        if not(self.X1 is None) and not(self.T1 is None):
-            self.__calibrateBy1Point(self.X1, self.T1)
-            return
-        if not(self.X2 is None) and not(self.T2 is None):
-            self.__calibrateBy1Point(self.X2, self.T2)
-            return
+class LazyDialog(QDialog):
+    """
+    Dialog whose widgets are created from ui_file when it is shown for the first time,
+    so that the main window opens without building all the dialogs
+    """
+    ui_file = None
+
+    def __init__(self, parent=None):
+        super(LazyDialog, self).__init__(parent)
+        self.ui_loaded = False
+
+    def setVisible(self, visible):
+        if visible and not self.ui_loaded:
+            load_ui(self.ui_file, self)
+            self.ui_loaded = True
+            self.setup_ui()
+        super().setVisible(visible)
+
+    def setup_ui(self):
+        """Connects the widgets and shows the data, called once after they are created"""
+        pass
+
 
+class CalibrationDialog(LazyDialog):
+    ui_file = 'calibration.ui'
 
-class CalibrationDialog(QDialog):
     def __init__(self, parent=None):
         super(CalibrationDialog, self).__init__(parent)
 
-        uic.loadUi('calibration.ui', self)
         self.data = [ChannelCalibration(), ChannelCalibration(), ChannelCalibration(), ChannelCalibration()]
         self.temp_data = [ChannelCalibration(), ChannelCalibration(), ChannelCalibration(), ChannelCalibration()]  # Temporary data until Ok is pressed
 
+        profile = load_last_profile()  # Calibration accepted in the previous run
+        if profile is not None and len(profile) == len(self.data):
+            self.data = profile
+            self.temp_data = [ChannelCalibration.fromDict(c.toDict()) for c in profile]
+
+    def setup_ui(self):
         self.buttonOhms1.toggled.connect(self.toggled_1_Ohms)
         self.buttonKelvin1.toggled.connect(self.toggled_1_Ohms)
         self.buttonOhms2.toggled.connect(self.toggled_2_Ohms)
@@ -127,45 +119,105 @@ class CalibrationDialog(QDialog):
         self.calApply3.clicked.connect(self.applyPoints3)
         self.calApply4.clicked.connect(self.applyPoints4)
 
-        self.RoffsetEdit1.setText(str(self.data[0].R_offset))
-        self.RscaleEdit1.setText(str(self.data[0].R_scale))
-        self.RoffsetEdit2.setText(str(self.data[1].R_offset))
-        self.RscaleEdit2.setText(str(self.data[1].R_scale))
-        self.RoffsetEdit3.setText(str(self.data[2].R_offset))
-        self.RscaleEdit3.setText(str(self.data[2].R_scale))
-        self.RoffsetEdit4.setText(str(self.data[3].R_offset))
-        self.RscaleEdit4.setText(str(self.data[3].R_scale))
+        self.calSave.clicked.connect(self.save_to_file)
+        self.calLoad.clicked.connect(self.load_from_file)
+
+        curves = available_curves() + [BROWSE_CURVE]
+        for i in range(len(self.temp_data)):
+            combo = getattr(self, "calCurve" + str(i + 1))
+            combo.addItems(curves)
+            combo.activated.connect(partial(self.select_curve, i))
+        self.show_temp_data()
+
+    def show_temp_data(self):
+        """Sets all widgets to the values of temp_data"""
+        if not self.ui_loaded:  # Done when the dialog is shown
+            return
+        for i, calibration in enumerate(self.temp_data):
+            n = str(i + 1)
+            getattr(self, "buttonOhms" + n).setChecked(calibration.useOhms)
+            getattr(self, "buttonKelvin" + n).setChecked(not calibration.useOhms)
+            getattr(self, "RoffsetEdit" + n).setText(str(calibration.R_offset))
+            getattr(self, "RscaleEdit" + n).setText(str(calibration.R_scale))
+            for field in ("X1", "X2", "T1", "T2"):
+                value = getattr(calibration, field)
+                getattr(self, "cal" + field + "_" + n).setText("" if value is None else str(value))
+            self.show_curve(i)
+
+    def save_to_file(self):
+        filename = QFileDialog.getSaveFileName(self, "Save Calibration", "", "Calibration (*.json)")[0]
+        if not filename:
+            return
+        try:
+            save_calibration(filename, self.temp_data)
+            self.statusLine.setText("Saved '" + filename + "'")
+        except OSError as err:
+            self.statusLine.setText("Error while saving '" + filename + "': " + str(err))
+
+    def load_from_file(self):
+        filename = QFileDialog.getOpenFileName(self, "Load Calibration", "", "Calibration (*.json)")[0]
+        if not filename:
+            return
+        try:
+            channels = load_calibration(filename)
+        except (OSError, ValueError) as err:
+            self.statusLine.setText("Error while loading '" + filename + "': " + str(err))
+            return
+        if len(channels) != len(self.temp_data):
+            self.statusLine.setText("Wrong number of channels in '" + filename + "'")
+            return
+        self.temp_data = channels
+        self.show_temp_data()
+        self.statusLine.setText("Loaded '" + filename + "'")
 
     def applyPoints1(self):
-        self.temp_data[0].calibrateByPoints()
-        self.RoffsetEdit1.setText(str(self.temp_data[0].R_offset))
-        self.RscaleEdit1.setText(str(self.temp_data[0].R_scale))
+        self.__apply_points(0)
 
     def applyPoints2(self):
-        self.temp_data[1].calibrateByPoints()
-        self.RoffsetEdit2.setText(str(self.temp_data[1].R_offset))
-        self.RscaleEdit2.setText(str(self.temp_data[1].R_scale))
+        self.__apply_points(1)
 
     def applyPoints3(self):
-        self.temp_data[2].calibrateByPoints()
-        self.RoffsetEdit3.setText(str(self.temp_data[2].R_offset))
-        self.RscaleEdit3.setText(str(self.temp_data[2].R_scale))
+        self.__apply_points(2)
 
     def applyPoints4(self):
-        self.temp_data[3].calibrateByPoints()
-        self.RoffsetEdit4.setText(str(self.temp_data[3].R_offset))
-        self.RscaleEdit4.setText(str(self.temp_data[3].R_scale))
+        self.__apply_points(3)
+
+    def __apply_points(self, index):
+        self.statusLine.setText("")
+        try:
+            self.temp_data[index].calibrateByPoints()
+        except ValueError as err:
+            self.statusLine.setText(str(err))
+        n = str(index + 1)
+        getattr(self, "RoffsetEdit" + n).setText(str(self.temp_data[index].R_offset))
+        getattr(self, "RscaleEdit" + n).setText(str(self.temp_data[index].R_scale))
+
+    def select_curve(self, index, item):
+        """Curve combo box item was chosen, the last one opens a curve file"""
+        combo = getattr(self, "calCurve" + str(index + 1))
+        name = combo.itemText(item)
+        if name == BROWSE_CURVE:
+            name = QFileDialog.getOpenFileName(self, "Select Curve", "", "Curves (*.340 *.dat)")[0]
+        if name:
+            try:
+                self.temp_data[index].set_curve(name)
+                self.statusLine.setText("")
+            except (OSError, ValueError) as err:
+                self.statusLine.setText("Error while loading curve '" + name + "': " + str(err))
+        self.show_curve(index)
+
+    def show_curve(self, index):
+        combo = getattr(self, "calCurve" + str(index + 1))
+        name = self.temp_data[index].curve_file
+        if combo.findText(name) < 0:
+            combo.insertItem(combo.count() - 1, name)
+        combo.setCurrentIndex(combo.findText(name))
 
     def applyCalibration(self, toT, device, vals):
+        """Calibrates the whole channel array at once, returns numpy array"""
         if device > 3 or device < 0 :
             raise IndexError("Calibration: device index is out of range [0, 3]")
-        out_vals = []
-        for v in vals:
-            if toT:
-                out_vals.append(self.data[device].evaluateT(v))
-            else:
-                out_vals.append(self.data[device].evaluateR(v))
-        return out_vals
+        return self.data[device].evaluateArray(toT, vals)
 
 
     def tryTextToFloat(self, text):
@@ -306,6 +358,7 @@ class CalibrationDialog(QDialog):
 
     def accept(self):
         self.data = self.temp_data.copy()
+        save_last_profile(self.data)
         self.statusLine.setText("")
         super().accept()
 
@@ -315,20 +368,195 @@ class CalibrationDialog(QDialog):
         super().reject()
 
 
-class FileDialog(QDialog):
+class FileLoader(QtCore.QObject):
+    """
+    Parses files in worker pools and passes each result to the GUI thread as soon as it is ready.
+    Lakeshore .xls parsing is CPU-bound pure python, so it is done in separate processes.
+    """
+    fileLoaded = QtCore.pyqtSignal(int, str, object, str)  # group, filename, result, status message
+    progress = QtCore.pyqtSignal(int, int)  # files done, files total
+    finished = QtCore.pyqtSignal()
+    _futureDone = QtCore.pyqtSignal(object)  # Emitted from pool threads, delivered in GUI thread
+
+    def __init__(self, parent=None):
+        super(FileLoader, self).__init__(parent)
+        self._process_pool = None  # Pools are created on first use
+        self._thread_pool = None
+        self._futures = {}  # {future: (group, filename, profiled)} of the files being loaded
+        self._n_done = 0
+        self._n_total = 0
+        self._futureDone.connect(self._on_future_done)
+
+    def process_pool(self):
+        if self._process_pool is None:
+            # Forking process with running Qt application is unsafe
+            self._process_pool = ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn"))
+        return self._process_pool
+
+    def thread_pool(self):
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor()
+        return self._thread_pool
+
+    def is_loading(self):
+        return bool(self._futures)
+
+    def load(self, group, filenames, parser, parser_version, use_processes):
+        """
+        parser(filename) -> (result, message) must be picklable for use_processes=True.
+        Files found in file_cache are memory-mapped right away without parsing.
+        """
+        pool = None
+        for fn in filenames:
+            result = file_cache.load(fn, parser_version)
+            if result is not None:
+                self._n_done += 1
+                self._n_total += 1
+                self.fileLoaded.emit(group, fn, result, "Loaded '" + fn + "' from cache")
+                continue
+            if pool is None:
+                pool = self.process_pool() if use_processes else self.thread_pool()
+            # Timings of worker processes are sent back with the result
+            profiled = use_processes and profiling.enabled()
+            if profiled:
+                future = pool.submit(profiling.call_profiled, file_cache.cached_parse, parser, parser_version, fn)
+            else:
+                future = pool.submit(file_cache.cached_parse, parser, parser_version, fn)
+            self._futures[future] = (group, fn, profiled)
+            self._n_total += 1
+            future.add_done_callback(self._futureDone.emit)
+        self.progress.emit(self._n_done, self._n_total)
+        if not self._futures:
+            self._finish()
+
+    def cancel(self):
+        """Not started files are dropped, results of the running ones are ignored"""
+        futures = self._futures
+        self._futures = {}
+        for future in futures:
+            future.cancel()
+        self._finish()
+
+    def shutdown(self):
+        self.cancel()
+        for pool in (self._process_pool, self._thread_pool):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self._process_pool = None
+        self._thread_pool = None
+
+    def _finish(self):
+        self._n_done = 0
+        self._n_total = 0
+        self.finished.emit()
+
+    def _on_future_done(self, future):
+        if future not in self._futures:  # Cancelled
+            return
+        group, fn, profiled = self._futures.pop(future)
+        try:
+            if profiled:
+                (result, message), stats = future.result()
+                profiling.merge(stats)
+            else:
+                result, message = future.result()
+        except Exception as err:  # E.g. crashed worker process
+            print("Error while opening file '", fn, "':", err)
+            result, message = FileRecord.failed(), "Error for '" + fn + "'"
+        self._n_done += 1
+        self.fileLoaded.emit(group, fn, result, message)
+        self.progress.emit(self._n_done, self._n_total)
+        if not self._futures:
+            self._finish()
+
+
+class Exporter(QtCore.QObject):
+    """
+    Writes export tables in a worker thread, so that the GUI stays responsive.
+    Progress is reported after every written chunk, cancel() stops after the current one.
+    """
+    progress = QtCore.pyqtSignal(int, int)  # rows written, rows total
+    finished = QtCore.pyqtSignal(str)  # status message
+    _jobDone = QtCore.pyqtSignal(object)  # Emitted from the worker thread, delivered in GUI thread
+
+    def __init__(self, parent=None):
+        super(Exporter, self).__init__(parent)
+        self._pool = None  # Created on first use
+        self._future = None
+        self._cancelled = threading.Event()
+        self._jobDone.connect(self._on_job_done)
+
+    def is_running(self):
+        return self._future is not None
+
+    def start(self, tables):
+        """tables is [(filename, column names, chunks, number of rows)], chunks are consumed in the worker thread"""
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=1)
+        self._cancelled.clear()
+        self._future = self._pool.submit(self._write, tables)
+        self._future.add_done_callback(self._jobDone.emit)
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def shutdown(self):
+        self.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def _write(self, tables):
+        total = sum(n_rows for filename, names, chunks, n_rows in tables)
+        n_written = 0
+        for filename, names, chunks, n_rows in tables:
+            n_written += write_table(filename, names, self._watch(chunks, n_written, total), n_rows)
+        if len(tables) == 1:
+            return "Exported " + str(n_written) + " rows to '" + tables[0][0] + "'"
+        return "Exported " + str(n_written) + " rows to " + str(len(tables)) + " files"
+
+    def _watch(self, chunks, n_written, total):
+        for ts, columns in chunks:
+            if self._cancelled.is_set():
+                raise ExportCancelled()
+            yield ts, columns
+            n_written += len(ts)
+            self.progress.emit(n_written, total)
+
+    def _on_job_done(self, future):
+        self._future = None
+        try:
+            message = future.result()
+        except ExportCancelled:
+            message = "Export cancelled"
+        except (OSError, ValueError) as err:
+            message = "Error while exporting: " + str(err)
+        self.finished.emit(message)
+
+
+class FileDialog(LazyDialog):
+    ui_file = 'file_browser.ui'
+
     def __init__(self, parent=None):
         super(FileDialog, self).__init__(parent)
 
-        uic.loadUi('file_browser.ui', self)
-        self.data1 = {}  # {"filename", ["status", x1s, y1s, x2s, y2s, ..., yns]}
-        self.data2 = {}
-        self.temp_data1 = {}  # Temporary data until Ok is pressed
-        self.temp_data2 = {}
+        self.data1 = ChannelStore()  # {"filename": FileRecord}
+        self.data2 = ChannelStore()
+        self.temp_data1 = self.data1.snapshot()  # Temporary data until Ok is pressed
+        self.temp_data2 = self.data2.snapshot()
+        self.loader = FileLoader(self)
+        self.loader.fileLoaded.connect(self.file_loaded)
+        self.loader.progress.connect(self.loading_progress)
+        self.loader.finished.connect(self.loading_finished)
+
+    def setup_ui(self):
         self.fbOpenBrowser1.clicked.connect(self.select_files1)
         self.fbOpenBrowser2.clicked.connect(self.select_files2)
         self.fbAddFile1.clicked.connect(self.add_files1)
         self.fbAddFile2.clicked.connect(self.add_files2)
-
+        self.fbCancelLoad.clicked.connect(self.loader.cancel)
+        self.fbClearCache.clicked.connect(self.clear_cache)
+        self.update_file_list()
 
     def select_files1(self):
         files = QFileDialog.getOpenFileNames(self, "Select Files",
@@ -351,90 +579,22 @@ class FileDialog(QDialog):
             self.fbLineEdit2.setText(text)
 
     def parse_lakeshore_file(self, filename):
-        try:
-            n_sensors = 4
-            book = xlrd.open_workbook(filename)
-            sh = book.sheet_by_index(0)
-            start_time = sh.cell_value(rowx=1, colx=1)  # B2 cell, "Thu Jan 21 14:04:03 NOVT 2021"
-
-            start_time = start_time.split(" ")[3]  # "14:04:03"
-            start_time = timestr_to_seconds(start_time)
-
-            if sh.nrows < 5:
-                raise IndexError("Empty data")
-            xs, ys = [], []
-            for s in range(n_sensors):
-                xs.append([])
-                ys.append([])
-            for rx in range(4, sh.nrows):
-                x = sh.cell_value(rowx=rx, colx=0)  # in milliseconds
-                try:
-                    x = float(x)
-                except ValueError:
-                    continue
-                x = start_time + 0.001 * x  # in seconds
-                for s in range(n_sensors):
-                    y = sh.cell_value(rowx=rx, colx=(1 + s))
-                    try:
-                        y = float(y)
-                    except ValueError:
-                        continue
-                    xs[s].append(x)
-                    ys[s].append(y)
-            result = ["Ok"]
-            for s in range(n_sensors):
-                result.append(np.array(xs[s]))
-                result.append(np.array(ys[s]))
-            self.fbStatusLine.setText("Loaded '" + filename + "'")
-            return result
-
-        except:
-            self.fbStatusLine.setText("Error for '" + filename + "'")
-            print("Error while opening file '", filename, "':", sys.exc_info()[0])
-            return ["Failed"]
+        result, message = parse_lakeshore_xls(filename)
+        self.fbStatusLine.setText(message)
+        return result
 
     def parse_pressure_file(self, filename):
-        line_n = 0
-        n_sensors = 4  # In reality there is always only 1 sensor in this file type
-        xs, ys = [], []
-        for s in range(n_sensors):
-            xs.append([])
-            ys.append([])
-        with open(filename, "r", encoding="iso-8859-1") as file:
-            for line in file:
-                line_n += 1
-                if line_n < 3:  # Header
-                    continue
-                line = line.replace(",", ".")
-                values = line.split(';')
-                p, t = 0, 0
-                try:
-                    p = float(values[0])
-                    t = values[2].split(" ")
-                    t = timestr_to_seconds(t[1])
-                    if t is None:
-                        continue
-                except ValueError:
-                    continue
-                xs[0].append(t)
-                ys[0].append(p)
-
-        if not xs[0]:
-            self.fbStatusLine.setText("Error for '" + filename + "'")
-            print("Error while opening file '", filename, "'")
-            return ["Failed"]
-        result = ["Ok"]
-        for s in range(n_sensors):
-            result.append(np.array(xs[s]))
-            result.append(np.array(ys[s]))
-        self.fbStatusLine.setText("Loaded '" + filename + "'")
+        result, message = parse_pressure_csv(filename)
+        self.fbStatusLine.setText(message)
         return result
 
     def update_file_list(self):
         """Displays currently loaded files"""
+        if not self.ui_loaded:  # Done when the dialog is shown
+            return
         file_list = []
         for i in self.temp_data1.items():
-            if i[1][0] != "Failed":
+            if i[1].ok:
                 if i[0] not in file_list:
                     file_list.append(i[0])
         file_list_text = ""
@@ -444,7 +604,7 @@ class FileDialog(QDialog):
 
         file_list = []
         for i in self.temp_data2.items():
-            if i[1][0] != "Failed":
+            if i[1].ok:
                 if i[0] not in file_list:
                     file_list.append(i[0])
         file_list_text = ""
@@ -455,36 +615,167 @@ class FileDialog(QDialog):
     def add_files1(self):
         text = self.fbLineEdit1.text()
         filenames = text.split(';')
-        for fn in filenames:
-            self.temp_data1[fn] = self.parse_lakeshore_file(fn)
+        self.loader.load(1, filenames, parse_lakeshore_xls, LAKESHORE_PARSER_VERSION, use_processes=True)
         self.fbLineEdit1.setText("")
-        self.update_file_list()
 
     def add_files2(self):
         text = self.fbLineEdit2.text()
         filenames = text.split(';')
-        for fn in filenames:
-            self.temp_data2[fn] = self.parse_pressure_file(fn)
+        self.loader.load(2, filenames, parse_pressure_csv, PRESSURE_PARSER_VERSION, use_processes=False)
         self.fbLineEdit2.setText("")
+
+    def clear_cache(self):
+        file_cache.clear()
+        self.fbStatusLine.setText("Cache of parsed files is cleared")
+
+    def file_loaded(self, group, filename, result, message):
+        if group == 1:
+            self.temp_data1[filename] = result
+        else:
+            self.temp_data2[filename] = result
+        self.fbStatusLine.setText(message)
         self.update_file_list()
 
+    def loading_progress(self, done, total):
+        self.fbProgressBar.setMaximum(total)
+        self.fbProgressBar.setValue(done)
+        self.fbProgressBar.setVisible(True)
+        self.fbCancelLoad.setVisible(True)
+        self.fbButtonBox.button(QDialogButtonBox.Ok).setEnabled(False)  # Until all files are loaded
+
+    def loading_finished(self):
+        if not self.ui_loaded:  # E.g. cancel() before the dialog was shown
+            return
+        self.fbProgressBar.setVisible(False)
+        self.fbCancelLoad.setVisible(False)
+        self.fbButtonBox.button(QDialogButtonBox.Ok).setEnabled(True)
+
     def accept(self):
-        self.data1 = self.temp_data1.copy()
-        self.data2 = self.temp_data2.copy()
+        self.data1 = self.temp_data1.snapshot()
+        self.data2 = self.temp_data2.snapshot()
         self.fbStatusLine.setText("")
         super().accept()
 
     def reject(self):
-        self.temp_data1 = self.data1.copy()
-        self.temp_data2 = self.data2.copy()
-        self.fbStatusLine.setText("")
+        self.loader.cancel()
+        self.temp_data1 = self.data1.snapshot()
+        self.temp_data2 = self.data2.snapshot()
+        if self.ui_loaded:
+            self.fbStatusLine.setText("")
         self.update_file_list()
         super().reject()
 
+class DiagnosticsDialog(LazyDialog):
+    """Timings of the hot paths recorded by profiling module and optional cProfile dump"""
+    ui_file = 'diagnostics.ui'
+
+    def __init__(self, parent=None):
+        super(DiagnosticsDialog, self).__init__(parent)
+        self.profiler = None
+
+    def setup_ui(self):
+        self.diagRecord.setChecked(profiling.enabled())
+        self.diagRecord.toggled.connect(profiling.enable)
+        self.diagReset.clicked.connect(self.reset)
+        self.diagProfile.clicked.connect(self.toggle_profiler)
+        self.diagClose.clicked.connect(self.close)
+        self.refresh_timer = QtCore.QTimer(self)
+        self.refresh_timer.setInterval(DIAGNOSTICS_REFRESH_INTERVAL)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        self.refresh()
+        self.refresh_timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.refresh_timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        stats = profiling.snapshot()
+        if not stats:
+            text = "No timings recorded" if profiling.enabled() else "Check 'Record timings' to measure"
+        else:
+            text = profiling.format_table(stats)
+        if text != self.diagTable.toPlainText():
+            self.diagTable.setPlainText(text)
+
+    def reset(self):
+        profiling.reset()
+        self.refresh()
+
+    def toggle_profiler(self):
+        """Profiles the GUI thread until pressed again, then saves pstats file (e.g. for snakeviz)"""
+        import cProfile
+        if self.profiler is None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+            self.diagProfile.setText("Stop cProfile")
+            return
+        self.profiler.disable()
+        profiler = self.profiler
+        self.profiler = None
+        self.diagProfile.setText("Start cProfile")
+        path = QFileDialog.getSaveFileName(self, "Save Profile", "", "Profile (*.prof)")[0]
+        if path:
+            profiler.dump_stats(path)
+
+
+class StatisticsDialog(LazyDialog):
+    """Rolling statistics over the last window of every plotted channel"""
+    ui_file = 'statistics.ui'
+
+    def __init__(self, parent=None):
+        super(StatisticsDialog, self).__init__(parent)
+        self.stats = {}  # {(channel name, data mode): RollingStats}
+        self.series = []  # Arguments of the last update_stats()
+
+    def setup_ui(self):
+        self.statWindow.valueChanged.connect(self.set_window)
+        self.statClose.clicked.connect(self.close)
+
+    def set_window(self, minutes):
+        self.stats = {}
+        self.update_stats(self.series)
+
+    def update_stats(self, series):
+        """
+        series is [(channel name, data mode, ts, ys)] of the plotted data. Only samples appended
+        since the previous call are processed for the channels with the same name and mode.
+        """
+        self.series = series
+        window = 60 * self.statWindow.value()
+        stats = {}
+        with profiling.stage("statistics"):
+            for name, mode, ts, ys in series:
+                rolling = self.stats.get((name, mode)) or RollingStats(window)
+                rolling.update(ts, ys)
+                stats[(name, mode)] = rolling
+        self.stats = stats
+        self.show_stats()
+
+    def show_stats(self):
+        self.statTable.setRowCount(len(self.stats))
+        self.statTable.setVerticalHeaderLabels([name for name, mode in self.stats])
+        for row, rolling in enumerate(self.stats.values()):
+            s = rolling.stats()
+            if s is None:
+                cells = ["0"] + [""] * 6
+            else:
+                stable = rolling.is_stable()
+                cells = [str(s.n)] + ["{:.6g}".format(v) for v in (s.mean, s.std, s.min, s.max, 60 * s.rate)]
+                cells.append("" if stable is None else "stable" if stable else "drifting")
+            for col, text in enumerate(cells):
+                self.statTable.setItem(row, col, QTableWidgetItem(text))
+
+
 class MyWindow(QMainWindow):
+    _tailRead = QtCore.pyqtSignal(object)  # Emitted from pool threads, delivered in GUI thread
+
     def __init__(self):
         super(MyWindow, self).__init__()
-        uic.loadUi('plot_window.ui', self)
+        load_ui('plot_window.ui', self)
 
         self.plt1 = self.graphW1.getPlotItem()
         axis1 = DateAxisItem(orientation='bottom')
@@ -531,8 +822,50 @@ class MyWindow(QMainWindow):
         self.plt2.getAxis('left').widthChanged.connect(self.align_axes)
         self.plt2.getViewBox().sigYRangeChanged.connect(self.align_axes)
 
-        self.plt1.scene().sigMouseMoved.connect(self.mouse_moved_plt1)
-        self.plt2.scene().sigMouseMoved.connect(self.mouse_moved_plt2)
+        # Only the last mouse position per frame is handled, so moving the mouse never queues work
+        screen = QApplication.primaryScreen()
+        rate = screen.refreshRate() if screen is not None and screen.refreshRate() > 0 else DEFAULT_CURSOR_RATE
+        self.mouse_proxy1 = pg.SignalProxy(self.plt1.scene().sigMouseMoved, rateLimit=rate, slot=self.mouse_moved_plt1)
+        self.mouse_proxy2 = pg.SignalProxy(self.plt2.scene().sigMouseMoved, rateLimit=rate, slot=self.mouse_moved_plt2)
+
+        self.timelines1 = TimelineIndex()  # All loaded files merged per channel
+        self.timelines2 = TimelineIndex()
+        self.calibration_cache = CalibrationCache()  # Calibrated pyramids of recently plotted channels
+        self.applied_calibration = {}  # {channel: parameters of the last update_graphs}
+        self.curves1 = CurvesModel(self.plt1)  # Persistent curve per channel
+        self.curves2 = CurvesModel(self.plt2)
+
+        self.tails1 = {}  # {filename: LakeshoreTail} of the followed files
+        self.tails2 = {}  # {filename: PressureTail}
+        self.tail_reads = {}  # {future: (filename, LakeshoreTail)} of the .xls files being read in the worker pool
+        self._tailRead.connect(self.tail_read_done)
+        self.truncated_tails = set()  # Followed files whose oldest samples are dropped
+        self.tail_timer = QtCore.QTimer(self)
+        self.tail_timer.setInterval(TAIL_POLL_INTERVAL)
+        self.tail_timer.timeout.connect(self.poll_tails)
+        self.refresh_timer = QtCore.QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.timeout.connect(self.refresh_followed)
+        self.last_refresh = 0.0
+        self.followCheckbox.stateChanged.connect(self.sync_tails)
+        self.dia.accepted.connect(self.sync_tails)
+
+        self.exporter = Exporter(self)
+        self.exporter.progress.connect(self.export_progress)
+        self.exporter.finished.connect(self.export_finished)
+        self.exportMergedButton.clicked.connect(self.export_merged)
+        self.exportViewButton.clicked.connect(self.export_view)
+        self.saveSessionButton.clicked.connect(self.save_session)
+        self.openSessionButton.clicked.connect(self.open_session)
+        self.diagnosticsButton.clicked.connect(self.open_diagnostics_dialog)
+        self.diag_dia = DiagnosticsDialog(self)
+        self.statisticsButton.clicked.connect(self.open_statistics_dialog)
+        self.stats_dia = StatisticsDialog(self)
+
+    def closeEvent(self, event):
+        self.exporter.shutdown()  # Running export is cancelled, its incomplete file is removed
+        self.dia.loader.shutdown()  # Loading and reading of followed files are stopped with the worker pools
+        super().closeEvent(event)
 
     def open_dialog(self):
         self.dia.show()
@@ -540,6 +873,13 @@ class MyWindow(QMainWindow):
     def open_calibration_dialog(self):
         self.calib_dia.show()
 
+    def open_diagnostics_dialog(self):
+        self.diag_dia.show()
+
+    def open_statistics_dialog(self):
+        self.stats_dia.show()
+        self.update_statistics()
+
     def align_axes(self):
         self.plt1.getAxis('left').setWidth()  # Auto width
         self.plt2.getAxis('left').setWidth()  # Auto width
@@ -550,57 +890,339 @@ class MyWindow(QMainWindow):
         self.plt2.getAxis('left').setWidth(w)
 
     def update_graphs(self):
-        color_scheme = [(255, 0, 0), (0, 0, 255), (0, 255, 0), (30, 30, 30)]
-        self.plt1.clear()
-        for i in self.dia.data1.items():
-            ncol = len(i[1])
-            if ncol < 3:
-                continue
-            for col in range((ncol - 1) // 2):
-                ts = i[1][col*2 + 1]
-                ys = i[1][col*2 + 2]
-                if self.plotRawCheckbox.isChecked():
-                    self.plt1.plot(ts, ys, pen=color_scheme[col])
+        """Recomputes only the curves of channels with changed files or calibration"""
+        with profiling.stage("update_graphs"):
+            color_scheme = [(255, 0, 0), (0, 0, 255), (0, 255, 0), (30, 30, 30)]
+            plot_raw = self.plotRawCheckbox.isChecked()
+            toT = self.plotTCheckbox.isChecked()
+            if self.timelines1.update(self.dia.data1):
+                serials = [timeline.serial for timeline in self.timelines1.channels]
+                self.calibration_cache.discard(lambda key: key[0] not in serials)
+            self.timelines2.update(self.dia.data2)
+            for col, calibration in enumerate(self.calib_dia.data):
+                parameters = calibration.parameters()
+                if self.applied_calibration.get(col, parameters) != parameters:
+                    self.calibration_cache.invalidate(col)
+                self.applied_calibration[col] = parameters
+            curves = {}
+            for col, timeline in enumerate(self.timelines1.channels):
+                if not len(timeline):
+                    continue
+                if plot_raw:
+                    data_key = (timeline.serial, "raw")
+                    make_pyramid = timeline.pyramid
                 else:
-                    ys = self.calib_dia.applyCalibration(self.plotTCheckbox.isChecked(), col, ys)
-                    self.plt1.plot(ts, ys, pen=color_scheme[col])
+                    data_key = (timeline.serial, toT, self.calib_dia.data[col].parameters())
+                    make_pyramid = partial(self.calibrated_pyramid, toT, col, timeline)
+                curves[col] = (data_key, make_pyramid, color_scheme[col])
+            self.curves1.set_curves(curves)
+
+            curves = {}
+            for col, timeline in enumerate(self.timelines2.channels):
+                if not len(timeline):
+                    continue
+                curves[col] = (timeline.serial, timeline.pyramid, color_scheme[col])
+            self.curves2.set_curves(curves)
+        if self.stats_dia.isVisible():
+            self.update_statistics()
+
+    def update_statistics(self):
+        """Statistics of the data as plotted (raw, R or T), appended data is processed incrementally"""
+        series = []
+        for col, (data_key, pyramid, item) in sorted(self.curves1.curves.items()):
+            mode = data_key[1:]
+            name = "X" if mode[0] == "raw" else "T" if mode[0] else "R"
+            series.append((name + str(col + 1), mode, pyramid.ts, pyramid.ys))
+        for col, (data_key, pyramid, item) in sorted(self.curves2.curves.items()):
+            series.append(("p" + str(col + 1), None, pyramid.ts, pyramid.ys))
+        self.stats_dia.update_stats(series)
+
+    def calibrated_pyramid(self, toT, col, timeline):
+        key = (timeline.serial, col, toT, self.calib_dia.data[col].parameters())
+        return self.calibration_cache.get(key, lambda: MinMaxPyramid(
+            timeline.ts, self.calib_dia.applyCalibration(toT, col, timeline.ys)))
+
+    def sync_tails(self):
+        """Starts following of loaded files (and stops following of removed ones) in follow mode"""
+        if not self.followCheckbox.isChecked():
+            self.tail_timer.stop()
+            self.tails1 = {}
+            self.tails2 = {}
+            self.truncated_tails = set()
+            return
+        # New tails start after the loaded records, which are kept
+        self.tails1 = {fn: self.tails1.get(fn) or LakeshoreTail(fn, record)
+                       for fn, record in self.dia.data1.items() if record.ok}
+        tails2 = {}
+        for fn, record in self.dia.data2.items():
+            if record.ok:
+                try:
+                    tails2[fn] = self.tails2.get(fn) or PressureTail(fn, record)
+                except OSError as err:
+                    print("Error while following file '", fn, "':", err)
+        self.tails2 = tails2
+        self.poll_tails()
+        self.tail_timer.start()
+
+    def poll_tails(self):
+        """Parses only data appended to the followed files since the last poll"""
+        reading = set(tail for fn, tail in self.tail_reads.values())
+        for fn, tail in self.tails1.items():
+            try:
+                if tail in reading or not tail.changed():
+                    continue
+            except OSError as err:
+                print("Error while following file '", fn, "':", err)
+                continue
+            # .xls file is read again as a whole, which would block the GUI
+            future = self.dia.loader.process_pool().submit(read_lakeshore_rows, fn, tail.next_row)
+            self.tail_reads[future] = (fn, tail)
+            future.add_done_callback(self._tailRead.emit)
+        for fn, tail in self.tails2.items():
+            try:
+                n_new = tail.poll()
+            except Exception as err:  # File may be in the middle of writing, try on the next poll
+                print("Error while following file '", fn, "':", err)
+                continue
+            if n_new:
+                self.tail_updated(fn, tail, self.dia.data2, self.dia.temp_data2)
 
-        self.plt2.clear()
-        for i in self.dia.data2.items():
-            ncol = len(i[1])
-            if ncol < 3:
+    def tail_read_done(self, future):
+        fn, tail = self.tail_reads.pop(future)
+        if future.cancelled() or self.tails1.get(fn) is not tail:  # Not followed any more
+            return
+        try:
+            n_new = tail.append_rows(*future.result())
+        except Exception as err:  # File may be in the middle of writing, try on the next poll
+            print("Error while following file '", fn, "':", err)
+            tail.stat = None
+            return
+        if n_new:
+            self.tail_updated(fn, tail, self.dia.data1, self.dia.temp_data1)
+
+    def tail_updated(self, fn, tail, data, temp_data):
+        data[fn] = tail.result()
+        if fn in temp_data:
+            temp_data[fn] = data[fn]
+        if tail.n_dropped and fn not in self.truncated_tails:
+            self.truncated_tails.add(fn)
+            self.statusbar.showMessage("Following '" + fn + "': only the last " + str(len(tail.ts)) +
+                                       " samples are kept")
+        if not self.refresh_timer.isActive():
+            delay = MIN_REFRESH_INTERVAL - 1000 * (time.monotonic() - self.last_refresh)
+            self.refresh_timer.start(int(max(delay, 0)))
+
+    def refresh_followed(self):
+        self.last_refresh = time.monotonic()
+        self.update_graphs()
+
+    def merge_channels(self):
+        """timebase.Channel of every loaded channel, files are joined and calibrated as plotted"""
+        plot_raw = self.plotRawCheckbox.isChecked()
+        toT = self.plotTCheckbox.isChecked()
+        self.timelines1.update(self.dia.data1)
+        self.timelines2.update(self.dia.data2)
+        channels = []
+        for col, timeline in enumerate(self.timelines1.channels):
+            if not len(timeline):
                 continue
-            for col in range((ncol - 1) // 2):
-                self.plt2.plot(i[1][col * 2 + 1], i[1][col * 2 + 2], pen=color_scheme[col])
+            name = str(col + 1)
+            if plot_raw:
+                channels.append(timebase.Channel("X" + name, timeline.ts, timeline.ys))
+            else:
+                # Copy, so that calibration changes do not affect an export running in the background
+                calibration = ChannelCalibration.fromDict(self.calib_dia.data[col].toDict())
+                convert = partial(calibration.evaluateArray, toT)
+                channels.append(timebase.Channel(("T" if toT else "R") + name, timeline.ts, timeline.ys, convert))
+        for col, timeline in enumerate(self.timelines2.channels):
+            if len(timeline):
+                channels.append(timebase.Channel("p" + str(col + 1), timeline.ts, timeline.ys))
+        return channels
+
+    def ask_merge(self, title):
+        """(time step, resampling method) or None if cancelled"""
+        dt, ok = QInputDialog.getDouble(self, title, "Time step, s:", DEFAULT_MERGE_STEP, 0.001, 86400.0, 3)
+        if not ok:
+            return None
+        method, ok = QInputDialog.getItem(self, title, "Resampling:", timebase.METHODS, 0, False)
+        if not ok:
+            return None
+        return dt, method
+
+    def ask_export_filename(self, title):
+        filters = ";;".join("*" + ext for ext in EXPORT_FORMATS)
+        filename, selected = QFileDialog.getSaveFileName(self, title, "", filters)
+        if filename and not os.path.splitext(filename)[1] and selected:
+            filename += selected[1:]  # "*.csv" filter
+        return filename
+
+    def export_merged(self):
+        if self.exporter.is_running():
+            self.exporter.cancel()
+            return
+        channels = self.merge_channels()
+        bounds = timebase.time_range(channels)
+        if bounds is None:
+            self.statusbar.showMessage("No data to export")
+            return
+        merge = self.ask_merge("Export merged")
+        if merge is None:
+            return
+        filename = self.ask_export_filename("Export merged")
+        if not filename:
+            return
+        t0, t1 = bounds
+        dt, method = merge
+        self.start_export([(filename, [c.name for c in channels], timebase.merge(channels, t0, t1, dt, method),
+                            timebase.merged_length(t0, t1, dt))])
+
+    def export_view(self):
+        """Exports the visible time range, per channel (every sample) or merged onto one timebase"""
+        if self.exporter.is_running():
+            self.exporter.cancel()
+            return
+        channels = self.merge_channels()
+        bounds = timebase.time_range(channels)
+        view_t0, view_t1 = self.plt1.getViewBox().viewRange()[0]  # Both plots show the same range
+        if bounds is None or view_t1 < bounds[0] or view_t0 > bounds[1]:
+            self.statusbar.showMessage("No data to export in the visible range")
+            return
+        t0, t1 = max(view_t0, bounds[0]), min(view_t1, bounds[1])
+        mode, ok = QInputDialog.getItem(self, "Export view", "Channels:", EXPORT_MODES, 0, False)
+        if not ok:
+            return
+        merge = self.ask_merge("Export view") if mode == EXPORT_MODES[1] else None
+        if mode == EXPORT_MODES[1] and merge is None:
+            return
+        filename = self.ask_export_filename("Export view")
+        if not filename:
+            return
+        if merge is not None:
+            dt, method = merge
+            tables = [(filename, [c.name for c in channels], timebase.merge(channels, t0, t1, dt, method),
+                       timebase.merged_length(t0, t1, dt))]
+        else:  # <name>_<channel>.<ext> per channel
+            root, ext = os.path.splitext(filename)
+            tables = []
+            for channel in channels:
+                i0, i1 = timebase.window(channel, t0, t1)
+                if i1 > i0:
+                    tables.append((root + "_" + channel.name + ext, [channel.name],
+                                   timebase.samples(channel, t0, t1), i1 - i0))
+        self.start_export(tables)
+
+    def start_export(self, tables):
+        for button in (self.exportMergedButton, self.exportViewButton):
+            button.setText("Cancel export")
+        self.statusbar.showMessage("Exporting ...")
+        self.exporter.start(tables)
+
+    def export_progress(self, n_written, n_total):
+        self.statusbar.showMessage("Exporting ... " + str(100 * n_written // max(n_total, 1)) + "%")
+
+    def export_finished(self, message):
+        self.exportMergedButton.setText("Export merged ...")
+        self.exportViewButton.setText("Export view ...")
+        self.statusbar.showMessage(message)
+
+    def cursor_readout(self, curves, timelines, t):
+        """Plotted values of the samples nearest to t of every visible channel and the file of the first one"""
+        texts = []
+        filename = None
+        for col, i, ts, y in curves.nearest(t):
+            texts.append(str(col + 1) + ": " + '{0:.6g}'.format(y))
+            if filename is None:
+                filename = timelines.channels[col].filename(i)  # Curves are plotted from the timelines
+        if filename is not None:
+            texts.append("(" + os.path.basename(filename) + ")")
+        return "  ".join(texts)
+
+    def save_session(self):
+        path = QFileDialog.getSaveFileName(self, "Save Session", "", "Session (*" + SESSION_EXTENSION + ")")[0]
+        if not path:
+            return
+        if not path.endswith(SESSION_EXTENSION):
+            path += SESSION_EXTENSION
+        self.timelines1.update(self.dia.data1)
+        self.timelines2.update(self.dia.data2)
+        calibrated = {}  # Calibrated pyramids which were already computed
+        for col, timeline in enumerate(self.timelines1.channels):
+            for toT in (False, True):
+                key = (timeline.serial, col, toT, self.calib_dia.data[col].parameters())
+                pyramid = self.calibration_cache.peek(key)
+                if pyramid is not None:
+                    calibrated[(col, toT)] = pyramid
+        try:
+            save_session(path, [self.dia.data1, self.dia.data2], [self.timelines1, self.timelines2],
+                         self.calib_dia.data, calibrated)
+        except (OSError, ValueError) as err:
+            self.statusbar.showMessage("Error while saving session '" + path + "': " + str(err))
+            return
+        self.statusbar.showMessage("Saved session '" + path + "'")
 
-        self.plt1.addItem(self.cursor_v1, ignoreBounds=True)
-        self.plt1.addItem(self.cursor_h1, ignoreBounds=True)
-        self.plt2.addItem(self.cursor_v2, ignoreBounds=True)
-        self.plt2.addItem(self.cursor_h2, ignoreBounds=True)
+    def open_session(self):
+        path = QFileDialog.getExistingDirectory(self, "Open Session")
+        if not path:
+            return
+        self.load_session(path)
 
-    def mouse_moved_plt1(self, coords):
+    def load_session(self, path):
+        """Replaces loaded files and calibration with the memory-mapped session"""
+        try:
+            (data1, data2), (timelines1, timelines2), calibration, calibrated = load_session(path)
+        except (OSError, ValueError) as err:
+            self.statusbar.showMessage("Error while opening session '" + path + "': " + str(err))
+            return
+        self.dia.loader.cancel()
+        self.dia.data1, self.dia.data2 = data1, data2
+        self.dia.temp_data1, self.dia.temp_data2 = data1.snapshot(), data2.snapshot()
+        self.dia.update_file_list()
+        self.timelines1, self.timelines2 = timelines1, timelines2
+        if len(calibration) == len(self.calib_dia.data):
+            self.calib_dia.data = calibration
+            self.calib_dia.temp_data = [ChannelCalibration.fromDict(c.toDict()) for c in calibration]
+            self.calib_dia.show_temp_data()
+        # Calibrated pyramids of the session are used if they were made with the current calibration
+        for col, calibration in enumerate(self.calib_dia.data):
+            self.applied_calibration[col] = calibration.parameters()
+        for (col, toT), (parameters_hash, pyramid) in calibrated.items():
+            if col < len(self.calib_dia.data) and parameters_hash == self.calib_dia.data[col].parametersHash():
+                key = (self.timelines1.channels[col].serial, col, toT, self.calib_dia.data[col].parameters())
+                self.calibration_cache.get(key, lambda: pyramid)
+        self.update_graphs()
+        self.sync_tails()
+        self.statusbar.showMessage("Opened session '" + path + "'")
+
+    def mouse_moved_plt1(self, event):
+        coords = event[0]
         mouse_point = self.plt1.getViewBox().mapSceneToView(coords)
-        ss = second_to_timestr(mouse_point.x(), "{H:02d}:{M:02d}:{s:06.3F}")
-        self.statusbar.showMessage("x1=" + ss+", y1=" + '{0:.6g}'.format(mouse_point.y()))
+        ss = second_to_timestr(mouse_point.x(), "{date} {H:02d}:{M:02d}:{s:06.3F}")
+        with profiling.stage("cursor_readout"):
+            readout = self.cursor_readout(self.curves1, self.timelines1, mouse_point.x())
+        self.statusbar.showMessage("x1=" + ss+", y1=" + '{0:.6g}'.format(mouse_point.y()) + "    " + readout)
         if self.plt1.sceneBoundingRect().contains(coords):
             self.cursor_v1.setPos(mouse_point.x())
             self.cursor_h1.setPos(mouse_point.y())
             self.cursor_v2.setPos(mouse_point.x())
 
-    def mouse_moved_plt2(self, coords):
+    def mouse_moved_plt2(self, event):
+        coords = event[0]
         mouse_point = self.plt2.getViewBox().mapSceneToView(coords)
-        ss = second_to_timestr(mouse_point.x(), "{H:02d}:{M:02d}:{s:06.3F}")
-        self.statusbar.showMessage("x2=" + ss + ", y2=" + '{0:.6g}'.format(mouse_point.y()))
+        ss = second_to_timestr(mouse_point.x(), "{date} {H:02d}:{M:02d}:{s:06.3F}")
+        with profiling.stage("cursor_readout"):
+            readout = self.cursor_readout(self.curves2, self.timelines2, mouse_point.x())
+        self.statusbar.showMessage("x2=" + ss + ", y2=" + '{0:.6g}'.format(mouse_point.y()) + "    " + readout)
         if self.plt2.sceneBoundingRect().contains(coords):
             self.cursor_v2.setPos(mouse_point.x())
             self.cursor_h2.setPos(mouse_point.y())
             self.cursor_v1.setPos(mouse_point.x())
 
-
 if __name__ == '__main__':
     from sys import argv, exit
 
     app = QApplication(argv)
     win = MyWindow()
     win.show()
+    if len(argv) > 1:  # test_qt.py <session directory>
+        win.load_session(argv[1])
     exit(app.exec_())
@@ -0,0 +1,100 @@
+"""
+Conversions between date/time strings and seconds. Qt-independent.
+Times are float64 seconds since 1970-01-01 00:00:00 of the wall clock time written
+by the loggers (their time zone is ignored), so that multi-day runs stay monotonic
+and are shown with the same hours as in the files.
+"""
+
+import numpy as np
+
+SECONDS_PER_DAY = 86400
+MONTHS = {name: i + 1 for i, name in enumerate(
+    ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"])}
+
+def timestr_to_seconds(string):
+    try:
+        start_time = string.split(":")
+        start_time = (int(start_time[0]) * 60 + int(start_time[1])) * 60 + float(start_time[2])
+    except (ValueError, IndexError) as err:
+        print("Error while converting string \"" + string + "\"to seconds")
+        print(err)
+        print(err.args)
+        return None
+    return start_time
+
+def days_from_civil(year, month, day):
+    """Days since 1970-01-01 of the proleptic Gregorian date, works for scalars and integer arrays"""
+    year = year - (month <= 2)
+    era = year // 400
+    yoe = year - era * 400
+    doy = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+def civil_from_days(days):
+    """Inverse of days_from_civil: (year, month, day) integer arrays"""
+    days = np.asarray(days, dtype=np.int64) + 719468
+    era = days // 146097
+    doe = days - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    day = doy - (153 * mp + 2) // 5 + 1
+    month = mp + np.where(mp < 10, 3, -9)
+    year = yoe + era * 400 + (month <= 2)
+    return year, month, day
+
+def lakeshore_datestr_to_seconds(string):
+    """"Thu Jan 21 14:04:03 NOVT 2021" -> seconds since epoch or None"""
+    try:
+        tokens = string.split()
+        day = int(days_from_civil(int(tokens[-1]), MONTHS[tokens[1]], int(tokens[2])))
+    except (ValueError, IndexError, KeyError) as err:
+        print("Error while converting string \"" + string + "\"to date")
+        print(err)
+        return None
+    seconds = timestr_to_seconds(tokens[3])
+    if seconds is None:
+        return None
+    return day * SECONDS_PER_DAY + seconds
+
+def pressure_datestr_to_seconds(string):
+    """"21.01.2021 14:04:03" (or "2021-01-21 14:04:03") -> seconds since epoch or None"""
+    try:
+        date, time = string.split()
+        if "-" in date:
+            year, month, day = date.split("-")
+        else:
+            day, month, year = date.split(".")
+        if not (1 <= int(month) <= 12 and 1 <= int(day) <= 31):
+            return None
+        day = int(days_from_civil(int(year), int(month), int(day)))
+        h, m, s = time.split(":")
+        seconds = (int(h) * 60 + int(m)) * 60 + float(s)
+    except ValueError:
+        return None
+    return day * SECONDS_PER_DAY + seconds
+
+def second_to_timestr(seconds, fmt):
+    """fmt fields: H, M, S (integer), s (float seconds), date ("2021-01-21"), day ("21.01")"""
+    return seconds_to_timestrs([seconds], fmt)[0]
+
+def seconds_to_timestrs(values, fmt):
+    """second_to_timestr for the whole array at once"""
+    values = np.asarray(values, dtype=np.float64)
+    whole = np.floor(values)
+    days = (whole // SECONDS_PER_DAY).astype(np.int64)
+    of_day = whole - days * SECONDS_PER_DAY
+    H = (of_day // 3600).astype(np.int64)
+    MM = of_day % 3600
+    M = (MM // 60).astype(np.int64)
+    S = (MM % 60).astype(np.int64)
+    s = S + values - whole
+    if "{date" in fmt or "{day" in fmt:
+        year, month, day = civil_from_days(days)
+        dates = ["{:04d}-{:02d}-{:02d}".format(y, mo, d) for y, mo, d in zip(year.tolist(), month.tolist(), day.tolist())]
+        day_strs = ["{:02d}.{:02d}".format(d, mo) for mo, d in zip(month.tolist(), day.tolist())]
+    else:
+        dates = day_strs = [""] * len(values)
+    return [fmt.format(H=h, M=m, S=sec, s=frac, date=date, day=day_str) for h, m, sec, frac, date, day_str in
+            zip(H.tolist(), M.tolist(), S.tolist(), s.tolist(), dates, day_strs)]
@@ -0,0 +1,215 @@
+"""
+Resampling of channels with different sample times onto one common timebase,
+so that e.g. pressure can be correlated with temperature. The merge is streamed:
+the timebase is processed in chunks and only the samples around each chunk are
+read (binary search), at most chunk_size of them at once even if a coarse time
+step covers many samples, so memory-mapped inputs larger than RAM can be merged.
+Qt-independent.
+"""
+
+import itertools
+import os
+import numpy as np
+
+MERGE_CHUNK_SIZE = 1 << 18  # Timebase points per chunk and samples read at once
+JOIN_CHUNK_SIZE = 1 << 22  # Samples copied at once by join_segments
+METHODS = ("linear", "mean")
+
+
+class Channel:
+    """Sorted samples (ts, ys) of one channel. convert(ys) is applied to the read samples only (e.g. calibration)"""
+    def __init__(self, name, ts, ys, convert=None):
+        self.name = name
+        self.ts = ts
+        self.ys = ys
+        self.convert = convert
+
+    def values(self, i0, i1):
+        ys = np.asarray(self.ys[i0:i1], dtype=np.float64)
+        if self.convert is not None:
+            ys = self.convert(ys)
+        return ys
+
+
+def is_sorted(ts):
+    return len(ts) < 2 or bool(np.all(ts[1:] >= ts[:-1]))
+
+
+def join_segments(segments, out_dir=None, name="channel"):
+    """
+    Joins [(ts, ys)] of several files into one sorted (ts, ys). Segments which do not
+    overlap in time are copied chunk by chunk into memory-mapped .npy files in out_dir
+    (or into memory if out_dir is None). Overlapping segments are sorted in memory.
+    """
+    segments = [(ts, ys) for ts, ys in segments if len(ts)]
+    if not segments:
+        return np.array([]), np.array([])
+    if len(segments) == 1 and is_sorted(segments[0][0]):
+        return segments[0]
+    segments.sort(key=lambda s: s[0][0])
+    disjoint = all(is_sorted(ts) for ts, ys in segments) and \
+        all(a[0][-1] <= b[0][0] for a, b in zip(segments[:-1], segments[1:]))
+    if not disjoint:
+        ts = np.concatenate([s[0] for s in segments])
+        order = np.argsort(ts, kind="stable")
+        return ts[order], np.concatenate([s[1] for s in segments])[order]
+    n = sum(len(ts) for ts, ys in segments)
+    if out_dir is None:
+        out_ts, out_ys = np.empty(n), np.empty(n, dtype=segments[0][1].dtype)
+    else:
+        out_ts = np.lib.format.open_memmap(os.path.join(out_dir, name + "_t.npy"), mode="w+", shape=(n,))
+        out_ys = np.lib.format.open_memmap(os.path.join(out_dir, name + "_y.npy"), mode="w+", shape=(n,),
+                                           dtype=segments[0][1].dtype)
+    pos = 0
+    for ts, ys in segments:
+        for i in range(0, len(ts), JOIN_CHUNK_SIZE):
+            chunk = slice(i, min(i + JOIN_CHUNK_SIZE, len(ts)))
+            k = chunk.stop - chunk.start
+            out_ts[pos:pos + k] = ts[chunk]
+            out_ys[pos:pos + k] = ys[chunk]
+            pos += k
+    return out_ts, out_ys
+
+
+def resample_linear(ts, ys, grid, max_gap=None):
+    """Linear interpolation at grid times. NaN outside of data and inside gaps longer than max_gap"""
+    if not len(ts):
+        return np.full(len(grid), np.nan)
+    out = np.interp(grid, ts, ys, left=np.nan, right=np.nan)
+    if max_gap is not None and len(ts) > 1:
+        right = np.clip(np.searchsorted(ts, grid, side="left"), 1, len(ts) - 1)
+        gap = ts[right] - ts[right - 1]
+        on_sample = ts[right] == grid
+        out[(gap > max_gap) & ~on_sample] = np.nan
+    return out
+
+
+def bin_sums(ts, ys, edges):
+    """(sums, counts) of the samples in [edges[i], edges[i + 1]) bins, NaN samples are ignored"""
+    idx = np.searchsorted(ts, edges, side="left")
+    valid = ~np.isnan(ys)
+    sums = np.concatenate(([0.0], np.cumsum(np.where(valid, ys, 0.0))))
+    counts = np.concatenate(([0], np.cumsum(valid)))
+    return sums[idx[1:]] - sums[idx[:-1]], counts[idx[1:]] - counts[idx[:-1]]
+
+
+def resample_mean(ts, ys, edges):
+    """Averages of the samples in [edges[i], edges[i + 1]) bins. NaN samples are ignored, empty bins are NaN"""
+    sums, counts = bin_sums(ts, ys, edges)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sums / counts
+
+
+def _valid_values(channel, i0, i1):
+    """(ts, ys) of the samples [i0, i1) with valid values"""
+    ts, ys = np.asarray(channel.ts[i0:i1], dtype=np.float64), channel.values(i0, i1)
+    valid = ~np.isnan(ys)
+    if not valid.all():
+        ts, ys = ts[valid], ys[valid]
+    return ts, ys
+
+
+def _valid_sample(channel, i, step, chunk_size):
+    """(t, y) of the nearest sample with valid value from index i in direction step (+-1), None if there is none"""
+    ts = channel.ts
+    block = 16  # Usually the sample itself is valid, longer runs of missing samples are read in growing blocks
+    while 0 <= i < len(ts):
+        k0, k1 = (max(i + 1 - block, 0), i + 1) if step < 0 else (i, min(i + block, len(ts)))
+        ys = channel.values(k0, k1)
+        valid = np.flatnonzero(~np.isnan(ys))
+        if len(valid):
+            k = valid[-1] if step < 0 else valid[0]
+            return float(ts[k0 + k]), ys[k]
+        i = k0 - 1 if step < 0 else k1
+        block = min(2 * block, chunk_size)
+    return None
+
+
+def _linear_column(channel, grid, max_gap, chunk_size):
+    """resample_linear of the channel reading at most chunk_size samples at once"""
+    ts = channel.ts
+    out = np.full(len(grid), np.nan)
+    i0 = int(np.searchsorted(ts, grid[0], side="right"))
+    i1 = int(np.searchsorted(ts, grid[-1], side="left"))
+    # Missing samples are not interpolated over, so the chunk is extended to the nearest valid samples
+    last = _valid_sample(channel, i0 - 1, -1, chunk_size)
+    following = _valid_sample(channel, i1, 1, chunk_size)
+    slices = (_valid_values(channel, k0, min(k0 + chunk_size, i1)) for k0 in range(i0, i1, chunk_size))
+    if following is not None:
+        slices = itertools.chain(slices, [(np.array([following[0]]), np.array([following[1]]))])
+    for chunk_ts, chunk_ys in slices:
+        if last is not None:  # Interpolation between slices
+            chunk_ts, chunk_ys = np.append(last[0], chunk_ts), np.append(last[1], chunk_ys)
+        if not len(chunk_ts):
+            continue
+        g0 = int(np.searchsorted(grid, chunk_ts[0], side="left"))
+        g1 = int(np.searchsorted(grid, chunk_ts[-1], side="right"))
+        out[g0:g1] = resample_linear(chunk_ts, chunk_ys, grid[g0:g1], max_gap)
+        last = chunk_ts[-1], chunk_ys[-1]
+    return out
+
+
+def _mean_column(channel, grid, dt, chunk_size):
+    """resample_mean of the channel reading at most chunk_size samples at once"""
+    ts = channel.ts
+    edges = np.append(grid - 0.5 * dt, grid[-1] + 0.5 * dt)
+    i0 = int(np.searchsorted(ts, edges[0], side="left"))
+    i1 = int(np.searchsorted(ts, edges[-1], side="left"))
+    sums = np.zeros(len(grid))
+    counts = np.zeros(len(grid), dtype=np.int64)
+    for k0 in range(i0, i1, chunk_size):
+        k1 = min(k0 + chunk_size, i1)
+        chunk_ts = np.asarray(ts[k0:k1], dtype=np.float64)
+        # Only the bins of this slice: from the bin of its first sample to the bin of the last one
+        j0 = int(np.searchsorted(edges, chunk_ts[0], side="right")) - 1
+        j1 = int(np.searchsorted(edges, chunk_ts[-1], side="right"))
+        chunk_sums, chunk_counts = bin_sums(chunk_ts, channel.values(k0, k1), edges[j0:j1 + 1])
+        sums[j0:j1] += chunk_sums
+        counts[j0:j1] += chunk_counts
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sums / counts
+
+
+def merge(channels, t0, t1, dt, method="linear", max_gap=None, chunk_size=MERGE_CHUNK_SIZE):
+    """
+    Yields (grid, [values of each channel]) chunks of the t0, t0 + dt, ... <= t1 timebase.
+    "linear" interpolates the samples, "mean" averages the samples within +-dt/2 of each point.
+    Channel times must be sorted.
+    """
+    if method not in METHODS:
+        raise ValueError("Unknown resampling method '" + str(method) + "'")
+    if dt <= 0:
+        raise ValueError("Time step must be positive")
+    n = merged_length(t0, t1, dt)
+    for k0 in range(0, n, chunk_size):
+        grid = t0 + dt * np.arange(k0, min(k0 + chunk_size, n), dtype=np.float64)
+        if method == "linear":
+            columns = [_linear_column(channel, grid, max_gap, chunk_size) for channel in channels]
+        else:
+            columns = [_mean_column(channel, grid, dt, chunk_size) for channel in channels]
+        yield grid, columns
+
+
+def window(channel, t0, t1):
+    """Index range [i0, i1) of the samples inside [t0, t1]"""
+    return int(np.searchsorted(channel.ts, t0, side="left")), int(np.searchsorted(channel.ts, t1, side="right"))
+
+
+def samples(channel, t0, t1, chunk_size=MERGE_CHUNK_SIZE):
+    """Yields (ts, [values]) chunks of the samples inside [t0, t1] without resampling"""
+    i0, i1 = window(channel, t0, t1)
+    for k0 in range(i0, i1, chunk_size):
+        k1 = min(k0 + chunk_size, i1)
+        yield np.asarray(channel.ts[k0:k1], dtype=np.float64), [channel.values(k0, k1)]
+
+
+def time_range(channels):
+    """(first, last) sample time over all channels or None if all are empty"""
+    bounds = [(c.ts[0], c.ts[-1]) for c in channels if len(c.ts)]
+    if not bounds:
+        return None
+    return min(b[0] for b in bounds), max(b[1] for b in bounds)
+
+
+def merged_length(t0, t1, dt):
+    return max(int(np.floor((t1 - t0) / dt + 1e-9)) + 1, 0)
@@ -0,0 +1,113 @@
+"""
+Per-channel timeline index over all loaded files. Samples of every file are
+merged into one sorted array with samples of overlapping files at the same
+time stored only once. Plotting and cursor readout use the MinMaxPyramid of the
+merged samples instead of walking over every file. Qt-independent.
+"""
+
+import itertools
+import numpy as np
+from decimation import MinMaxPyramid
+from timebase import is_sorted
+
+_serials = itertools.count()
+
+
+class ChannelTimeline:
+    """
+    Sorted samples of one channel from several files. When files have samples at the
+    same time, the samples of the file which starts earlier are kept (repeated times
+    within one file are kept). file_index[i] is the index into filenames of the file
+    sample i came from.
+    """
+    def __init__(self, segments):
+        """segments is [(filename, ts, ys)], samples with NaN ys are left out"""
+        self.serial = next(_serials)  # Unique for the lifetime of the program, unlike id()
+        segments = sorted((s for s in map(self._valid, segments) if len(s[1])), key=lambda s: s[1][0])
+        self.filenames = [s[0] for s in segments]
+        self.file_index = None  # None if all samples are from filenames[0]
+        if not segments:
+            self.ts = np.array([])
+            self.ys = np.array([])
+            self._pyramid = None
+            return
+        if len(segments) == 1 and is_sorted(segments[0][1]):  # Views of the file record, no copy
+            ts, ys = segments[0][1], segments[0][2]
+            file_index = None
+        else:
+            ts = np.concatenate([s[1] for s in segments])
+            ys = np.concatenate([s[2] for s in segments])
+            file_index = np.repeat(np.arange(len(segments), dtype=np.int32), [len(s[1]) for s in segments])
+            if not is_sorted(ts):
+                order = np.argsort(ts, kind="stable")
+                ts, ys, file_index = ts[order], ys[order], file_index[order]
+        if file_index is not None:
+            # Every run of equal times keeps the samples of the file of its first sample
+            new_time = np.concatenate(([True], ts[1:] != ts[:-1]))
+            if not new_time.all():
+                keep = file_index == file_index[new_time][np.cumsum(new_time) - 1]
+                if not keep.all():
+                    ts, ys, file_index = ts[keep], ys[keep], file_index[keep]
+        self.ts = ts
+        self.ys = ys
+        self.file_index = file_index
+        self._pyramid = None
+
+    @staticmethod
+    def from_arrays(filenames, ts, ys, file_index=None, pyramid=None):
+        """Timeline of already merged sorted arrays (e.g. memory-mapped from a session)"""
+        timeline = ChannelTimeline([])
+        timeline.filenames = list(filenames)
+        timeline.ts = ts
+        timeline.ys = ys
+        timeline.file_index = file_index
+        timeline._pyramid = pyramid
+        return timeline
+
+    def pyramid(self):
+        """MinMaxPyramid of the raw values, built on first use"""
+        if self._pyramid is None:
+            self._pyramid = MinMaxPyramid(self.ts, self.ys)
+        return self._pyramid
+
+    @staticmethod
+    def _valid(segment):
+        filename, ts, ys = segment
+        valid = ~np.isnan(ys)
+        if valid.all():
+            return segment
+        return filename, ts[valid], ys[valid]
+
+    def __len__(self):
+        return len(self.ts)
+
+    def filename(self, i):
+        return self.filenames[0 if self.file_index is None else self.file_index[i]]
+
+
+class TimelineIndex:
+    """Timelines of all channels of FileDialog data (ChannelStore), rebuilt only when records change"""
+    def __init__(self):
+        self.sources = []  # [(filename, record)], records are kept alive so identity comparison is safe
+        self.channels = []
+
+    def update(self, data):
+        """Returns True if the index was rebuilt"""
+        sources = self._sources(data)
+        if len(sources) == len(self.sources) and \
+                all(a[0] == b[0] and a[1] is b[1] for a, b in zip(sources, self.sources)):
+            return False
+        self.sources = sources
+        n_channels = max(record.n_channels for fn, record in sources) if sources else 0
+        self.channels = [ChannelTimeline([(fn,) + record.channel(c) for fn, record in sources if c < record.n_channels])
+                         for c in range(n_channels)]
+        return True
+
+    def restore(self, data, channels):
+        """Sets channels built before for data"""
+        self.sources = self._sources(data)
+        self.channels = channels
+
+    @staticmethod
+    def _sources(data):
+        return [(fn, record) for fn, record in sorted(data.items(), key=lambda item: item[0]) if record.ok]
@@ -0,0 +1,70 @@
+"""
+Creation of widgets from Qt Designer .ui files without parsing the XML at every start.
+Each .ui file is compiled by uic to a python module once and the module is kept in
+UI_CACHE_DIR (its bytecode is cached by python as usual). The cache entry is keyed by
+the path, size and modification time of the .ui file and the PyQt version, so edited
+.ui files are compiled again. If the cache can't be written, uic.loadUi is used instead.
+"""
+
+import hashlib
+import importlib.util
+import io
+import os
+from PyQt5.QtCore import PYQT_VERSION_STR
+
+PACKAGE_DIR = os.path.dirname(os.path.realpath(__file__))
+UI_CACHE_DIR = os.environ.get("LAKESHORE_VIEWER_UI_CACHE",
+                              os.path.join(os.path.expanduser("~"), ".cache", "LakeshoreViewer", "ui"))
+
+_modules = {}  # {cache path: compiled module}
+
+
+def _cache_path(path):
+    st = os.stat(path)
+    key = "|".join([path, str(st.st_size), str(st.st_mtime_ns), PYQT_VERSION_STR])
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(UI_CACHE_DIR, "ui_" + name + "_" + hashlib.sha1(key.encode("utf-8")).hexdigest()[:16] + ".py")
+
+
+def _compile(path, cache_path):
+    from PyQt5 import uic  # The compiler is needed only when the .ui file changed
+    source = io.StringIO()
+    uic.compileUi(path, source)
+    os.makedirs(UI_CACHE_DIR, exist_ok=True)
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        file.write(source.getvalue())
+    os.replace(tmp_path, cache_path)
+
+
+def _module(cache_path):
+    module = _modules.get(cache_path)
+    if module is None:
+        spec = importlib.util.spec_from_file_location(os.path.splitext(os.path.basename(cache_path))[0], cache_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _modules[cache_path] = module
+    return module
+
+
+def load_ui(ui_file, widget):
+    """
+    Same as uic.loadUi(ui_file, widget): creates the widgets as children and attributes of widget.
+    Relative ui_file is resolved relative to the package.
+    """
+    path = ui_file if os.path.isabs(ui_file) else os.path.join(PACKAGE_DIR, ui_file)
+    try:
+        cache_path = _cache_path(path)
+        if not os.path.exists(cache_path):
+            _compile(path, cache_path)
+        module = _module(cache_path)
+    except (OSError, SyntaxError, ImportError) as err:
+        print("Error while compiling '", path, "':", err)
+        from PyQt5 import uic
+        return uic.loadUi(path, widget)
+    ui_class = next(value for name, value in vars(module).items() if name.startswith("Ui_"))
+    ui = ui_class()
+    ui.setupUi(widget)
+    for name, value in vars(ui).items():
+        setattr(widget, name, value)
+    return widget